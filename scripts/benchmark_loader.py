@@ -0,0 +1,65 @@
+import sys
+import time
+from pathlib import Path
+
+import torch
+import typer
+from loguru import logger
+from PIL import Image
+from torch.utils.data import Subset
+
+# Permite importar los módulos de src/
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+from datasets.day_loader import CustomYOLODataset, DevicePrefetcher, make_loader  # noqa: E402
+
+app = typer.Typer()
+
+
+class Resize:
+    """Redimensiona a un cuadrado imgsz x imgsz para poder apilar las imágenes en batches."""
+    def __init__(self, imgsz):
+        self.imgsz = imgsz
+
+    def __call__(self, image):
+        return image.resize((self.imgsz, self.imgsz), Image.BILINEAR)
+
+
+@app.command()
+def main(
+    csv_file: str = typer.Option("train.csv", "--csv-file", help="Manifiesto de dataset_csv.py, relativo a --root-dir."),
+    root_dir: str = typer.Option("data", "--root-dir", help="Carpeta respecto a la que son relativas las rutas del CSV."),
+    imgsz: int = typer.Option(640, "--imgsz", help="Tamaño al que se redimensionan las imágenes."),
+    batch_size: int = typer.Option(16, "--batch-size", help="Tamaño del batch del loader."),
+    workers: int = typer.Option(4, "--workers", help="Workers del DataLoader."),
+    max_samples: int = typer.Option(512, "--max-samples", help="Imágenes a leer en cada modo."),
+    device: str = typer.Option("cuda" if torch.cuda.is_available() else "cpu", "--device", help="Dispositivo de destino de los batches."),
+):
+    """
+    Compara el rendimiento (imágenes/s) de leer CustomYOLODataset muestra a muestra, como
+    se hacía hasta ahora, con el loader por batches (collate, workers y buffers pinned).
+    """
+    dataset = CustomYOLODataset(csv_file, root_dir, transform=Resize(imgsz))
+    dataset = Subset(dataset, range(min(max_samples, len(dataset))))
+    n = len(dataset)
+
+    start = time.perf_counter()
+    for i in range(n):
+        image, target = dataset[i]
+    single = n / (time.perf_counter() - start)
+    logger.info(f"Muestra a muestra: {single:.1f} img/s")
+
+    loader = DevicePrefetcher(make_loader(dataset, batch_size=batch_size, num_workers=workers, shuffle=False), device)
+    iterator = iter(loader)
+    next(iterator)  # Arranque de los workers, fuera de la medida
+    seen, start = 0, time.perf_counter()
+    for images, target in iterator:
+        seen += len(images)
+    if device.startswith("cuda"):
+        torch.cuda.synchronize()
+    batched = seen / (time.perf_counter() - start)
+    logger.info(f"Por batches ({workers} workers, batch={batch_size}, {device}): {batched:.1f} img/s")
+    logger.success(f"✅ Aceleración: x{batched / single:.2f}")
+
+
+if __name__ == "__main__":
+    app()
@@ -1,7 +1,14 @@
 # Contenido para run_experiments.py
 import typer
+import csv
+import itertools
+import json
+import os
+import random
+import shutil
 import subprocess
 import sys
+from pathlib import Path
 from loguru import logger
 
 app = typer.Typer()
@@ -17,16 +24,194 @@ EXPERIMENTS = [
     {"model": "yolov8m", "epochs": 150},
     # Puedes añadir más aquí...
     # {"model": "yolov8m", "epochs": 150},
+    # Destilación: añade "teacher" con los pesos del profesor y "model" será el alumno
+    # {"model": "yolov8n", "epochs": 150, "teacher": "models/yolov8m_150epochs/weights/best.pt"},
 ]
 
+# --- ESPACIO DE BÚSQUEDA PARA EL MODO 'search' ---
+# Cada combinación es un posible ensayo. Las claves distintas de model/imgsz/batch se
+# pasan a Ultralytics como hiperparámetros (--set clave=valor).
+SEARCH_SPACE = {
+    "model": ["yolov8n", "yolov8s", "yolov8m"],
+    "imgsz": [480, 640, 960],
+    "batch": [8, 16],
+    "mosaic": [0.0, 1.0],
+    "fliplr": [0.0, 0.5],
+    "degrees": [0.0, 10.0],
+}
+
 # -----------------------------------------
 
+MODELS_DIR = Path("models")
+REGISTRY_SOURCE_ENV = "RUN_REGISTRY_SOURCE"  # Los entrenamientos lanzados se registran con este origen
+METRIC_COLUMN = "metrics/mAP50-95(B)"
+
+
+def run_command(command) -> int:
+    """Ejecuta un comando mostrando su salida en tiempo real y devuelve el código de retorno."""
+    # Se usa Popen para ver la salida en tiempo real
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, encoding='utf-8', errors='replace')
+
+    # Imprimir la salida del subproceso en tiempo real
+    while True:
+        output = process.stdout.readline()
+        if output == '' and process.poll() is not None:
+            break
+        if output:
+            print(output.strip())
+
+    return process.poll() # Obtener el código de retorno
+
+
+def read_metric(run_dir: Path):
+    """Última fila de results.csv de Ultralytics: (épocas completadas, mAP50-95)."""
+    results_path = run_dir / "results.csv"
+    if not results_path.exists():
+        return 0, None
+    with open(results_path, newline="", encoding="utf-8") as f:
+        # Las cabeceras de Ultralytics vienen con espacios de relleno
+        rows = [{k.strip(): v for k, v in row.items()} for row in csv.DictReader(f)]
+    if not rows:
+        return 0, None
+    return len(rows), float(rows[-1][METRIC_COLUMN])
+
+
+def sample_trials(num_trials: int, seed: int):
+    """Muestra `num_trials` combinaciones distintas del SEARCH_SPACE (todas si hay menos)."""
+    keys = list(SEARCH_SPACE)
+    grid = [dict(zip(keys, values)) for values in itertools.product(*SEARCH_SPACE.values())]
+    random.Random(seed).shuffle(grid)
+    return grid[:num_trials]
+
+
+def trial_command(trial: dict, max_epochs: int, data: str, stop_at: int):
+    config = trial["config"]
+    run_dir = MODELS_DIR / trial["name"]
+    resume_path = run_dir / "weights" / "resume.pt"
+    command = [sys.executable, "src/modeling/train_ultralytics.py", "--name", trial["name"], "--stop-at-epoch", str(stop_at)]
+    if resume_path.exists():
+        return command + ["--resume-from", str(resume_path)]
+    command += [
+        "--model", config["model"], "--epochs", str(max_epochs), "--imgsz", str(config["imgsz"]),
+        "--batch-size", str(config["batch"]), "--data", data,
+    ]
+    for key, value in config.items():
+        if key not in {"model", "imgsz", "batch"}:
+            command += ["--set", f"{key}={value}"]
+    return command
+
+
+@app.command()
+def search(
+    name: str = typer.Option("search", "--name", help="Nombre de la búsqueda (carpeta models/<name>_state.json y prefijo de los ensayos)."),
+    num_trials: int = typer.Option(27, "--trials", help="Número de configuraciones iniciales."),
+    min_epochs: int = typer.Option(10, "--min-epochs", help="Épocas del primer escalón."),
+    max_epochs: int = typer.Option(150, "--max-epochs", help="Épocas del entrenamiento completo (calendario de LR)."),
+    eta: int = typer.Option(3, "--eta", help="Factor de reducción: sólo pasa 1/eta de los ensayos a cada escalón."),
+    data: str = typer.Option("./data/interim/primordia_split/data.yaml", "--data", help="data.yaml del dataset."),
+    keep_losers: bool = typer.Option(False, "--keep-losers", help="Conservar los pesos de los ensayos descartados."),
+    seed: int = typer.Option(42, "--seed", help="Semilla para elegir las configuraciones."),
+):
+    """
+    Búsqueda de hiperparámetros con successive halving (Hyperband de un solo bracket):
+    todos los ensayos entrenan hasta --min-epochs, sólo el mejor 1/eta continúa hasta el
+    siguiente escalón (x eta épocas), y así hasta --max-epochs. Los ensayos se pausan y
+    reanudan desde su checkpoint, y el estado se guarda tras cada paso para poder
+    relanzar el comando y continuar donde se quedó.
+    """
+    os.environ[REGISTRY_SOURCE_ENV] = f"run_experiments:{name}"
+    state_path = MODELS_DIR / f"{name}_state.json"
+    rungs = [min_epochs]
+    while rungs[-1] * eta < max_epochs:
+        rungs.append(rungs[-1] * eta)
+    rungs.append(max_epochs)
+
+    if state_path.exists():
+        state = json.loads(state_path.read_text(encoding="utf-8"))
+        logger.info(f"🔁 Reanudando la búsqueda '{name}' desde {state_path}.")
+    else:
+        state = {
+            "rungs": rungs, "max_epochs": max_epochs, "eta": eta, "data": data,
+            "trials": [
+                {"name": f"{name}_t{i:02d}", "config": config, "status": "active", "epochs": 0, "metrics": {}}
+                for i, config in enumerate(sample_trials(num_trials, seed))
+            ],
+        }
+    rungs, max_epochs, eta, data = state["rungs"], state["max_epochs"], state["eta"], state["data"]
+
+    def save_state():
+        MODELS_DIR.mkdir(parents=True, exist_ok=True)
+        state_path.write_text(json.dumps(state, indent=2), encoding="utf-8")
+
+    save_state()
+    logger.info(f"🚀 {len(state['trials'])} ensayos, escalones en las épocas {rungs}.")
+
+    for rung_idx, rung in enumerate(rungs):
+        active = [t for t in state["trials"] if t["status"] == "active"]
+        logger.info("---------------------------------------------------------")
+        logger.info(f"▶️  Escalón {rung_idx + 1}/{len(rungs)}: {len(active)} ensayos hasta la época {rung}")
+        logger.info("---------------------------------------------------------")
+
+        for trial in active:
+            if str(rung) in trial["metrics"]:
+                continue  # Ya completado en una ejecución anterior
+            logger.info(f"Ensayo {trial['name']} {trial['config']} ({trial['epochs']} -> {rung} épocas)")
+            rc = run_command(trial_command(trial, max_epochs, data, rung))
+            epochs, metric = read_metric(MODELS_DIR / trial["name"])
+            trial["epochs"] = epochs
+            if rc != 0 or metric is None:
+                logger.error(f"❌ El ensayo {trial['name']} falló con código {rc}. Se descarta.")
+                trial["status"] = "failed"
+            else:
+                trial["metrics"][str(rung)] = metric
+                logger.success(f"✅ {trial['name']}: mAP50-95={metric:.4f} en la época {epochs}")
+            save_state()
+
+        if rung == rungs[-1]:
+            break
+
+        # Promoción: sólo el mejor 1/eta continúa; el resto libera disco
+        finished = sorted(
+            (t for t in state["trials"] if t["status"] == "active"),
+            key=lambda t: t["metrics"][str(rung)], reverse=True,
+        )
+        keep = max(1, len(finished) // eta)
+        for trial in finished[keep:]:
+            trial["status"] = "stopped"
+            if not keep_losers:
+                shutil.rmtree(MODELS_DIR / trial["name"] / "weights", ignore_errors=True)
+        logger.info(f"Pasan {keep} de {len(finished)} ensayos: {[t['name'] for t in finished[:keep]]}")
+        save_state()
+
+    ranked = sorted(
+        (t for t in state["trials"] if t["metrics"]),
+        key=lambda t: (max(int(r) for r in t["metrics"]), t["metrics"][max(t["metrics"], key=int)]),
+        reverse=True,
+    )
+    if ranked:
+        best = ranked[0]
+        for trial in state["trials"]:
+            if trial["status"] == "active":
+                trial["status"] = "done"
+        save_state()
+        logger.success(f"🏆 Mejor configuración: {best['config']} (models/{best['name']}, mAP50-95={best['metrics'][max(best['metrics'], key=int)]:.4f})")
+    logger.info("🏁 Búsqueda finalizada.")
+
+
+@app.callback(invoke_without_command=True)
+def default(ctx: typer.Context):
+    """Sin subcomando se lanza 'run', como antes de existir 'search'."""
+    if ctx.invoked_subcommand is None:
+        run()
+
+
 @app.command()
 def run():
     """
     Lanza secuencialmente todos los entrenamientos definidos en la lista EXPERIMENTS.
     """
     logger.info(f"🚀 Se van a lanzar {len(EXPERIMENTS)} experimentos de entrenamiento.")
+    os.environ[REGISTRY_SOURCE_ENV] = "run_experiments"
     
     for i, exp in enumerate(EXPERIMENTS):
         model_name = exp["model"]
@@ -45,21 +230,21 @@ def run():
             "--epochs",
             str(num_epochs),
         ]
+        if "teacher" in exp:
+            command = [
+                sys.executable,
+                "src/modeling/distill.py",
+                "--teacher",
+                exp["teacher"],
+                "--student",
+                model_name,
+                "--epochs",
+                str(num_epochs),
+            ]
 
         try:
             # Ejecutar el comando del entrenamiento
-            # Se usa Popen para ver la salida en tiempo real
-            process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, encoding='utf-8', errors='replace')
-            
-            # Imprimir la salida del subproceso en tiempo real
-            while True:
-                output = process.stdout.readline()
-                if output == '' and process.poll() is not None:
-                    break
-                if output:
-                    print(output.strip())
-            
-            rc = process.poll() # Obtener el código de retorno
+            rc = run_command(command)
             
             if rc == 0:
                 logger.success(f"✅ Experimento {i+1} completado con éxito.")
@@ -1,5 +1,4 @@
 import shutil
-import random
 from pathlib import Path
 import pandas as pd  # Necesitaremos pandas para manejar los CSVs
 
@@ -9,6 +8,7 @@ import typer
 # Asumimos que estas variables apuntan a las carpetas data/raw y data/processed
 # según la configuración de tu proyecto Cookiecutter.
 from config import PROCESSED_DATA_DIR, RAW_DATA_DIR
+from tools.split_strategies import SplitStrategy, assign_splits, build_index
 
 app = typer.Typer()
 
@@ -19,7 +19,9 @@ def main(
     data_subdir: str = typer.Option("primordia", help="Subdirectorio específico del dataset."),
     val_split_ratio: float = typer.Option(0.20, "--split-ratio", help="Proporción de datos para el conjunto de validación."),
     image_ext: str = typer.Option(".webp", "--image-ext", help="Extensión de los ficheros de imagen."),
-    seed: int = typer.Option(42, "--seed", help="Semilla para la división aleatoria de los datos.")
+    seed: int = typer.Option(42, "--seed", help="Semilla para la división aleatoria de los datos."),
+    strategy: SplitStrategy = typer.Option(SplitStrategy.random, "--strategy", help="Estrategia de división: random, day, group o stratified."),
+    group_key: str = typer.Option(None, "--group-key", help="Campo de los metadatos JSON usado para agrupar con --strategy group (ej. la cama). Obligatorio con esa estrategia.")
 ):
     """
     Crea ficheros CSV (train.csv y val.csv) en la carpeta PROCESSED
@@ -27,7 +29,6 @@ def main(
     """
     # --- 1. CONFIGURACIÓN Y RUTAS ---
     logger.info("🚀 Creando los manifiestos CSV del dataset...")
-    random.seed(seed)
 
     raw_dir = RAW_DATA_DIR / data_subdir
     processed_dir = PROCESSED_DATA_DIR / data_subdir
@@ -42,44 +43,43 @@ def main(
     # Asegurarse de que el directorio de salida exista
     processed_dir.mkdir(parents=True, exist_ok=True)
 
-    # --- 2. DESCUBRIR TODOS LOS DATOS ---
+    # --- 2. DESCUBRIR TODOS LOS DATOS (ÍNDICE CACHEADO) ---
     logger.info(f"Buscando etiquetas en {raw_labels_dir}...")
-    all_label_files = list(raw_labels_dir.glob("*.txt"))
-
-    dataset_records = []
-    for label_path in all_label_files:
-        base_name = label_path.stem
-        image_path = raw_images_dir / f"{base_name}{image_ext}"
-        metadata_path = raw_metadata_dir / f"{base_name}.json"
-
-        # Solo añadir el registro si la imagen correspondiente existe
-        if image_path.exists():
-            dataset_records.append({
-                "image_path": str(image_path.relative_to(RAW_DATA_DIR.parent)),
-                "label_path": str(label_path.relative_to(RAW_DATA_DIR.parent)),
-                "metadata_path": str(metadata_path.relative_to(RAW_DATA_DIR.parent))
-            })
-        else:
-            logger.warning(f"No se encontró la imagen para la etiqueta {label_path.name}. Se omitirá.")
-
-    if not dataset_records:
+    index = build_index(raw_labels_dir, raw_images_dir, raw_metadata_dir)
+
+    if not index.empty:
+        # Sólo consideramos las imágenes con la extensión indicada, como hasta ahora
+        index = index[index["image_path"].str.endswith(image_ext)].reset_index(drop=True)
+
+    if index.empty:
         logger.error("No se encontraron pares de imagen/etiqueta válidos. Abortando.")
         raise typer.Exit()
-        
-    logger.info(f"Se encontraron {len(dataset_records)} registros completos (imagen, etiqueta, metadatos).")
 
-    # --- 3. MEZCLAR Y DIVIDIR LOS REGISTROS ---
-    random.shuffle(dataset_records)
-    
-    split_point = int(len(dataset_records) * (1 - val_split_ratio))
-    train_records = dataset_records[:split_point]
-    val_records = dataset_records[split_point:]
+    logger.info(f"Se encontraron {len(index)} registros completos (imagen, etiqueta, metadatos).")
+
+    # --- 3. DIVIDIR LOS REGISTROS SEGÚN LA ESTRATEGIA ---
+    try:
+        split = assign_splits(
+            index, {"train": 1 - val_split_ratio, "val": val_split_ratio},
+            strategy, group_key=group_key, seed=seed
+        )
+    except ValueError as e:
+        logger.error(f"No se pudo dividir el dataset: {e}")
+        raise typer.Exit()
+
+    root = RAW_DATA_DIR.parent
+    dataset_records = pd.DataFrame({
+        col: [str(Path(p).relative_to(root)) for p in index[col]]
+        for col in ["image_path", "label_path", "metadata_path"]
+    })
+    train_records = dataset_records[(split == "train").to_numpy()]
+    val_records = dataset_records[(split == "val").to_numpy()]
 
-    logger.success(f"División de datos: {len(train_records)} entrenamiento | {len(val_records)} validación.")
+    logger.success(f"División de datos: {len(train_records)} entrenamiento | {len(val_records)} validación (estrategia: {strategy.value}).")
 
     # --- 4. CREAR Y GUARDAR LOS DATAFRAMES ---
-    train_df = pd.DataFrame(train_records)
-    val_df = pd.DataFrame(val_records)
+    train_df = train_records.reset_index(drop=True)
+    val_df = val_records.reset_index(drop=True)
     
     train_csv_path = processed_dir / "train.csv"
     val_csv_path = processed_dir / "val.csv"
@@ -1,42 +1,178 @@
 # Este código iría en tu script de entrenamiento o en un fichero aparte como src/data/datasets.py
+import csv
+import os
+import random
+
+import numpy as np
 import torch
-import pandas as pd
 from PIL import Image
-from torch.utils.data import Dataset
-import os
+from torch.utils.data import DataLoader, Dataset, get_worker_info
+
+
+class PathIndex:
+    """
+    Lista de rutas guardada como un único array de bytes más un array de offsets.
+
+    Una lista de str (o un DataFrame) son miles de objetos Python: al iterarlos en un worker
+    el contador de referencias escribe en sus páginas y el copy-on-write acaba duplicando
+    toda la memoria en cada proceso. Dos arrays de numpy no tienen ese problema.
+    """
+    def __init__(self, paths):
+        encoded = [p.encode("utf-8") for p in paths]
+        self.blob = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+        self.offsets = np.cumsum([0] + [len(e) for e in encoded], dtype=np.int64)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        return self.blob[self.offsets[index]:self.offsets[index + 1]].tobytes().decode("utf-8")
+
 
 class CustomYOLODataset(Dataset):
     """
     Dataset personalizado que lee un fichero CSV para cargar imágenes y etiquetas.
     """
     def __init__(self, csv_file, root_dir, transform=None):
-        self.annotations = pd.read_csv(os.path.join(root_dir, csv_file))
+        with open(os.path.join(root_dir, csv_file), newline="", encoding="utf-8") as f:
+            rows = list(csv.DictReader(f))
+        self.image_paths = PathIndex([os.path.join(root_dir, r["image_path"]) for r in rows])
+        self.label_paths = PathIndex([os.path.join(root_dir, r["label_path"]) for r in rows])
         self.root_dir = root_dir
         self.transform = transform
 
     def __len__(self):
-        return len(self.annotations)
+        return len(self.image_paths)
 
     def __getitem__(self, index):
-        # Construye las rutas completas a los ficheros usando el CSV
-        img_path = os.path.join(self.root_dir, self.annotations.iloc[index]['image_path'])
-        label_path = os.path.join(self.root_dir, self.annotations.iloc[index]['label_path'])
-        
         # Carga la imagen
-        image = Image.open(img_path).convert("RGB")
-        
-        # Carga las etiquetas del fichero .txt de YOLO
+        image = Image.open(self.image_paths[index]).convert("RGB")
+
+        # Carga las etiquetas del fichero .txt de YOLO (class_id, x, y, w, h)
         boxes = []
-        with open(label_path) as f:
+        with open(self.label_paths[index]) as f:
             for line in f.readlines():
-                class_id, x, y, w, h = [float(x) for x in line.strip().split()]
-                boxes.append([class_id, x, y, w, h])
-        
-        boxes = torch.tensor(boxes)
+                if line.strip():
+                    boxes.append([float(v) for v in line.split()])
+
+        boxes = torch.tensor(boxes, dtype=torch.float32).reshape(-1, 5)
         target = {"boxes": boxes}
 
         # Aplica transformaciones si existen
         if self.transform:
             image = self.transform(image)
-            
-        return image, target
\ No newline at end of file
+
+        return image, target
+
+
+# --- Carga por batches ---
+def to_uint8_tensor(image):
+    """PIL/ndarray HWC -> tensor CHW uint8 (la normalización a float se deja para la GPU)."""
+    if isinstance(image, torch.Tensor):
+        return image
+    return torch.from_numpy(np.array(image)).permute(2, 0, 1)
+
+
+def yolo_collate(batch):
+    """
+    Junta muestras (imagen, {'boxes'}) en un batch:
+      - images: tensor (B, C, H, W); todas las imágenes deben tener el mismo tamaño.
+      - boxes:  tensor (N, 6) con [batch_idx, class_id, x, y, w, h], el formato de
+        Ultralytics, porque cada imagen tiene un número distinto de cajas.
+
+    El tensor de salida se reserva una sola vez con su tamaño final y, dentro de un worker,
+    directamente en memoria compartida para que no haya que copiarlo al pasarlo al proceso
+    principal.
+    """
+    images = [to_uint8_tensor(image) for image, _ in batch]
+    shapes = {tuple(image.shape) for image in images}
+    if len(shapes) > 1:
+        raise ValueError(f"Las imágenes del batch tienen tamaños distintos {sorted(shapes)}; añade un transform que las redimensione.")
+
+    in_worker = get_worker_info() is not None
+    out = torch.empty((len(images), *images[0].shape), dtype=images[0].dtype)
+    if in_worker:
+        out.share_memory_()
+    torch.stack(images, out=out)
+
+    boxes = [target["boxes"] for _, target in batch]
+    counts = torch.tensor([len(b) for b in boxes])
+    packed = torch.empty((int(counts.sum()), 6), dtype=torch.float32)
+    if in_worker:
+        packed.share_memory_()
+    packed[:, 0] = torch.repeat_interleave(torch.arange(len(boxes), dtype=torch.float32), counts)
+    if len(packed):
+        packed[:, 1:] = torch.cat(boxes)
+    return out, {"boxes": packed}
+
+
+def seed_worker(worker_id):
+    """Semilla distinta y reproducible por worker para numpy y random (torch ya la hereda)."""
+    seed = torch.initial_seed() % 2**32
+    np.random.seed(seed)
+    random.seed(seed)
+
+
+def make_loader(dataset, batch_size=16, num_workers=4, shuffle=True, seed=42, pin_memory=False, drop_last=False):
+    """
+    DataLoader por batches para CustomYOLODataset (o ShardedYOLODataset con shuffle=False).
+    Para GPU es mejor envolverlo en DevicePrefetcher que usar pin_memory=True, que pinea
+    memoria nueva en cada batch.
+
+    Los workers sólo se mantienen entre épocas si el dataset no tiene set_epoch(): un
+    worker persistente conserva su copia del dataset y nunca vería la época nueva.
+    """
+    generator = torch.Generator()
+    generator.manual_seed(seed)
+    return DataLoader(
+        dataset,
+        batch_size=batch_size,
+        shuffle=shuffle,
+        num_workers=num_workers,
+        collate_fn=yolo_collate,
+        worker_init_fn=seed_worker,
+        generator=generator,
+        pin_memory=pin_memory,
+        persistent_workers=num_workers > 0 and not hasattr(dataset, "set_epoch"),
+        prefetch_factor=4 if num_workers > 0 else None,
+        drop_last=drop_last,
+    )
+
+
+class DevicePrefetcher:
+    """
+    Envía los batches a la GPU copiándolos a unos pocos buffers pinned reservados una sola
+    vez (en lugar de pinear memoria nueva en cada batch) y con copias asíncronas, así el
+    proceso principal no se bloquea esperando a la copia. En CPU se limita a devolver los
+    batches del loader.
+    """
+    def __init__(self, loader, device, num_buffers=2):
+        self.loader, self.device = loader, torch.device(device)
+        self.num_buffers = num_buffers
+        self.buffers, self.events = {}, [None] * num_buffers
+
+    def __len__(self):
+        return len(self.loader)
+
+    def _pinned(self, slot, images):
+        buffer = self.buffers.get(slot)
+        if buffer is None or buffer.shape != images.shape or buffer.dtype != images.dtype:
+            buffer = torch.empty(images.shape, dtype=images.dtype, pin_memory=True)
+            self.buffers[slot] = buffer
+        return buffer
+
+    def __iter__(self):
+        if self.device.type != "cuda":
+            yield from self.loader
+            return
+        for i, (images, target) in enumerate(self.loader):
+            slot = i % self.num_buffers
+            if self.events[slot] is not None:
+                self.events[slot].synchronize()  # La copia anterior desde este buffer ya terminó
+            buffer = self._pinned(slot, images)
+            buffer.copy_(images)
+            images = buffer.to(self.device, non_blocking=True)
+            boxes = target["boxes"].to(self.device, non_blocking=True)
+            self.events[slot] = torch.cuda.Event()
+            self.events[slot].record()
+            yield images, {"boxes": boxes}
@@ -0,0 +1,104 @@
+import io
+import json
+import os
+import random
+import tarfile
+
+import torch
+import torch.distributed as dist
+from PIL import Image
+from torch.utils.data import IterableDataset, get_worker_info
+
+
+def iter_shard(path):
+    """
+    Recorre un shard .tar en modo streaming ('r|') y agrupa los ficheros consecutivos con
+    la misma clave en una muestra {'__key__': ..., 'webp': bytes, 'txt': bytes, ...}.
+    """
+    sample, current_key = {}, None
+    with tarfile.open(path, "r|") as tar:
+        for member in tar:
+            if not member.isfile():
+                continue
+            key, ext = member.name.rsplit(".", 1)
+            if key != current_key and sample:
+                yield sample
+                sample = {}
+            current_key = key
+            sample["__key__"] = key
+            sample[ext.lower()] = tar.extractfile(member).read()
+    if sample:
+        yield sample
+
+
+class ShardedYOLODataset(IterableDataset):
+    """
+    Dataset en streaming sobre los shards de tools/export_shards.py.
+
+    Cada worker (y cada proceso, en entrenamiento distribuido) lee un subconjunto disjunto
+    de shards de principio a fin, así que sólo se abre un fichero por shard en vez de dos
+    por imagen. El orden de los shards se mezcla en cada época y las muestras pasan por un
+    buffer de mezcla de tamaño `shuffle_buffer`.
+    """
+    IMAGE_KEYS = ("webp", "jpg", "jpeg", "png", "bmp")
+
+    def __init__(self, shards_dir, split="train", transform=None, shuffle_buffer=1000, seed=42):
+        with open(os.path.join(shards_dir, f"{split}.json"), encoding="utf-8") as f:
+            self.index = json.load(f)
+        self.shards = [os.path.join(shards_dir, s["file"]) for s in self.index["shards"]]
+        self.transform = transform
+        self.shuffle_buffer = shuffle_buffer
+        self.seed = seed
+        self.epoch = 0
+
+    def set_epoch(self, epoch):
+        """Cambia la semilla de la mezcla; llamar al principio de cada época."""
+        self.epoch = epoch
+
+    def __len__(self):
+        return self.index["samples"]
+
+    def _my_shards(self):
+        rank, world_size = 0, 1
+        if dist.is_available() and dist.is_initialized():
+            rank, world_size = dist.get_rank(), dist.get_world_size()
+        worker = get_worker_info()
+        worker_id, num_workers = (worker.id, worker.num_workers) if worker else (0, 1)
+
+        shards = list(self.shards)
+        random.Random(self.seed + self.epoch).shuffle(shards)  # Mismo orden en todos los workers
+        return shards[rank * num_workers + worker_id::world_size * num_workers]
+
+    def _decode(self, sample):
+        image_key = next(k for k in self.IMAGE_KEYS if k in sample)
+        image = Image.open(io.BytesIO(sample[image_key])).convert("RGB")
+
+        # Carga las etiquetas en formato YOLO (class_id, x, y, w, h)
+        boxes = [
+            [float(v) for v in line.split()]
+            for line in sample.get("txt", b"").decode("utf-8").splitlines() if line.strip()
+        ]
+        boxes = torch.tensor(boxes).reshape(-1, 5)
+        metadata = json.loads(sample["json"]) if sample.get("json") else {}
+        target = {"boxes": boxes, "metadata": metadata, "key": sample["__key__"]}
+
+        if self.transform:
+            image = self.transform(image)
+        return image, target
+
+    def __iter__(self):
+        worker = get_worker_info()
+        rng = random.Random(self.seed + self.epoch * 1000 + (worker.id if worker else 0))
+        buffer = []
+        for shard in self._my_shards():
+            for sample in iter_shard(shard):
+                if len(buffer) < self.shuffle_buffer:
+                    buffer.append(sample)
+                    continue
+                # Sustituye una muestra aleatoria del buffer y la devuelve
+                i = rng.randrange(len(buffer))
+                buffer[i], sample = sample, buffer[i]
+                yield self._decode(sample)
+        rng.shuffle(buffer)
+        for sample in buffer:
+            yield self._decode(sample)
@@ -0,0 +1,154 @@
+import typer
+from pathlib import Path
+import csv
+import shutil
+import sys
+from loguru import logger
+from tqdm import tqdm
+from ultralytics import YOLO
+
+# Permite importar los módulos de src/ al ejecutar como script (python src/modeling/...)
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from config import IMAGE_EXTENSIONS  # noqa: E402
+from modeling.boxes import box_iou  # noqa: E402
+from tools.dedup import BKTree, dhash  # noqa: E402
+
+app = typer.Typer()
+
+
+def disagreement(boxes_a, boxes_b, iou_thr=0.5):
+    """
+    Desacuerdo entre dos conjuntos de detecciones (listas de xyxy): 1 - F1 del
+    emparejamiento voraz por IoU. 0 si coinciden, 1 si no comparten ninguna caja.
+    """
+    if not boxes_a and not boxes_b:
+        return 0.0
+    unmatched = list(range(len(boxes_b)))
+    matches = 0
+    for a in boxes_a:
+        best, best_iou = None, iou_thr
+        for j in unmatched:
+            iou = box_iou(a, boxes_b[j])
+            if iou >= best_iou:
+                best, best_iou = j, iou
+        if best is not None:
+            unmatched.remove(best)
+            matches += 1
+    return 1.0 - 2 * matches / (len(boxes_a) + len(boxes_b))
+
+
+def confidence_uncertainty(confs, low, high):
+    """
+    Densidad de detecciones ambiguas: suma de (1 - |2c - 1|) para las confianzas
+    dentro de la banda [low, high]. Crece con el número de cajas dudosas.
+    """
+    return sum(1.0 - abs(2 * c - 1) for c in confs if low <= c <= high)
+
+
+def run_batched(model, image_paths, batch_size, conf, augment=False, desc="Inferencia"):
+    """Inferencia por lotes; devuelve {ruta: (xyxy, confs, xywhn, clases)}."""
+    outputs = {}
+    for start in tqdm(range(0, len(image_paths), batch_size), desc=desc, colour="green"):
+        batch = [str(p) for p in image_paths[start:start + batch_size]]
+        for path, result in zip(batch, model.predict(source=batch, conf=conf, augment=augment, batch=len(batch), verbose=False)):
+            boxes = result.boxes
+            outputs[Path(path)] = (
+                boxes.xyxy.tolist(), boxes.conf.tolist(), boxes.xywhn.tolist(), boxes.cls.int().tolist()
+            )
+    return outputs
+
+
+@app.command()
+def main(
+    weights_path: Path = typer.Option(..., "--weights-path", help="Pesos del modelo actual (ej: models/experimento/weights/best.pt)."),
+    input_dir: Path = typer.Option(..., "--input-dir", help="Carpeta con imágenes sin etiquetar."),
+    output_dir: Path = typer.Option(Path("data/interim/labeling_queue"), "--output-dir", help="Carpeta donde se guardará la cola de etiquetado."),
+    method: str = typer.Option("confidence", "--method", help="Medida de incertidumbre: confidence, tta o checkpoints."),
+    second_weights: Path = typer.Option(None, "--second-weights", help="Segundo checkpoint para --method checkpoints."),
+    budget: int = typer.Option(100, "--budget", help="Número de imágenes a seleccionar para etiquetar."),
+    batch_size: int = typer.Option(16, "--batch-size", help="Imágenes por lote en la inferencia."),
+    conf: float = typer.Option(0.1, "--conf", help="Confianza mínima de las detecciones consideradas."),
+    band: str = typer.Option("0.25,0.6", "--band", help="Banda de confianza 'baja,alta' considerada ambigua."),
+    pre_conf: float = typer.Option(0.5, "--pre-conf", help="Confianza mínima para incluir una caja en la pre-anotación."),
+    min_distance: int = typer.Option(8, "--min-distance", help="Distancia de Hamming mínima entre hashes perceptuales de imágenes seleccionadas (diversidad). 0 para desactivar."),
+    copy_images: bool = typer.Option(True, "--copy-images/--no-copy-images", help="Copiar las imágenes seleccionadas a la cola."),
+):
+    """
+    Ordena imágenes sin etiquetar por incertidumbre del modelo y genera una cola de
+    etiquetado diversa con pre-anotaciones YOLO (.txt).
+    """
+    logger.info(f"Cargando modelo desde: {weights_path}")
+    if not weights_path.exists():
+        logger.error("El fichero de pesos especificado no existe.")
+        raise typer.Exit(code=1)
+    if method not in {"confidence", "tta", "checkpoints"}:
+        logger.error(f"Método desconocido '{method}'. Usa confidence, tta o checkpoints.")
+        raise typer.Exit(code=1)
+    if method == "checkpoints" and (second_weights is None or not second_weights.exists()):
+        logger.error("El método 'checkpoints' necesita un --second-weights existente.")
+        raise typer.Exit(code=1)
+    low, high = [float(x) for x in band.split(",")]
+
+    image_paths = sorted(p for p in input_dir.rglob("*.*") if p.suffix.lower() in IMAGE_EXTENSIONS)
+    if not image_paths:
+        logger.error(f"No se encontraron imágenes en {input_dir}")
+        raise typer.Exit(code=1)
+    logger.info(f"Puntuando {len(image_paths)} imágenes con el método '{method}'...")
+
+    # --- 1. Inferencia por lotes ---
+    model = YOLO(weights_path)
+    predictions = run_batched(model, image_paths, batch_size, conf)
+
+    # --- 2. Puntuación de incertidumbre ---
+    if method == "confidence":
+        scores = {p: confidence_uncertainty(pred[1], low, high) for p, pred in predictions.items()}
+    else:
+        if method == "tta":
+            other = run_batched(model, image_paths, batch_size, conf, augment=True, desc="Inferencia TTA")
+        else:
+            other = run_batched(YOLO(second_weights), image_paths, batch_size, conf, desc="Inferencia 2º modelo")
+        scores = {p: disagreement(pred[0], other[p][0]) for p, pred in predictions.items()}
+
+    ranked = sorted(image_paths, key=lambda p: scores[p], reverse=True)
+
+    # --- 3. Selección diversa ---
+    # Se recorre el ranking descartando las imágenes casi idénticas a una ya elegida
+    selected, tree = [], BKTree()
+    for path in ranked:
+        if len(selected) >= budget:
+            break
+        if min_distance > 0:
+            value = dhash(path)
+            if tree.query(value, min_distance - 1):
+                continue
+            tree.add(value, len(selected))
+        selected.append(path)
+    logger.info(f"Seleccionadas {len(selected)} imágenes de {len(ranked)}.")
+
+    # --- 4. Cola de etiquetado y pre-anotaciones ---
+    labels_dir = output_dir / "labels"
+    images_dir = output_dir / "images"
+    labels_dir.mkdir(parents=True, exist_ok=True)
+    if copy_images:
+        images_dir.mkdir(parents=True, exist_ok=True)
+
+    queue_path = output_dir / "queue.csv"
+    with open(queue_path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["rank", "image_path", "score", "n_preannotated"])
+        for rank, path in enumerate(selected, start=1):
+            _, confs, xywhn, classes = predictions[path]
+            lines = [
+                f"{cls} {x:.6f} {y:.6f} {w:.6f} {h:.6f}"
+                for cls, c, (x, y, w, h) in zip(classes, confs, xywhn) if c >= pre_conf
+            ]
+            (labels_dir / f"{path.stem}.txt").write_text("\n".join(lines) + ("\n" if lines else ""), encoding="utf-8")
+            if copy_images:
+                shutil.copy(path, images_dir / path.name)
+            writer.writerow([rank, str(path), f"{scores[path]:.4f}", len(lines)])
+
+    logger.success(f"✅ Cola de etiquetado guardada en: {queue_path}")
+
+
+if __name__ == "__main__":
+    app()
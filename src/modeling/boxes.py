@@ -0,0 +1,18 @@
+"""Utilidades de cajas compartidas por los scripts de inferencia y etiquetado."""
+
+
+def box_iou(a, b):
+    """IoU entre dos cajas xyxy."""
+    ix1, iy1 = max(a[0], b[0]), max(a[1], b[1])
+    ix2, iy2 = min(a[2], b[2]), min(a[3], b[3])
+    inter = max(0.0, ix2 - ix1) * max(0.0, iy2 - iy1)
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+def xywh_iou(a, b):
+    """IoU entre dos cajas YOLO normalizadas (xc, yc, w, h)."""
+    return box_iou(
+        (a[0] - a[2] / 2, a[1] - a[3] / 2, a[0] + a[2] / 2, a[1] + a[3] / 2),
+        (b[0] - b[2] / 2, b[1] - b[3] / 2, b[0] + b[2] / 2, b[1] + b[3] / 2),
+    )
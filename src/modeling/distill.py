@@ -0,0 +1,180 @@
+import typer
+from pathlib import Path
+import shutil
+import sys
+import yaml
+from loguru import logger
+from tqdm import tqdm
+from ultralytics import YOLO
+
+# Permite importar los módulos de src/ al ejecutar como script (python src/modeling/...)
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from config import IMAGE_EXTENSIONS, INTERIM_DATA_DIR, MODELS_DIR  # noqa: E402
+from modeling.boxes import xywh_iou  # noqa: E402
+from tools.compose_dataset import link_or_copy  # noqa: E402
+from tools.dedup import file_hash  # noqa: E402
+from tools.image_pyramid import resolve_data_yaml  # noqa: E402
+from tools.run_registry import track  # noqa: E402
+
+app = typer.Typer()
+
+
+def labels_dir_for(images_dir: Path) -> Path:
+    """Carpeta de etiquetas según la convención de Ultralytics (último 'images' -> 'labels')."""
+    parts = list(images_dir.parts)
+    if "images" in parts:
+        parts[len(parts) - 1 - parts[::-1].index("images")] = "labels"
+    return Path(*parts)
+
+
+def read_boxes(path: Path):
+    """Lee un .txt YOLO; admite una sexta columna opcional con la confianza."""
+    if not path.exists():
+        return []
+    boxes = []
+    for line in path.read_text(encoding="utf-8").splitlines():
+        values = line.split()
+        if len(values) >= 5:
+            boxes.append([int(float(values[0]))] + [float(v) for v in values[1:6]])
+    return boxes
+
+
+def cache_teacher_outputs(teacher_path: Path, image_paths, cache_dir: Path, img_size: int, batch_size: int, conf: float) -> dict:
+    """
+    Ejecuta el profesor una única vez por imagen y guarda sus detecciones
+    ('cls xc yc w h conf') en `cache_dir`, una por SHA-1 del contenido de la imagen: dos
+    imágenes con el mismo nombre en carpetas distintas no se pisan, y una imagen
+    modificada tiene otra clave. Las ya cacheadas no se vuelven a inferir en siguientes
+    entrenamientos. Devuelve {imagen: fichero de la caché}.
+    """
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    entries = {p: cache_dir / f"{file_hash(p)}.txt" for p in tqdm(image_paths, desc="Hash de las imágenes", leave=False)}
+    pending = [p for p, entry in entries.items() if not entry.exists()]
+    logger.info(f"Salidas del profesor: {len(image_paths) - len(pending)} en caché, {len(pending)} por calcular.")
+    if not pending:
+        return entries
+
+    teacher = YOLO(teacher_path)
+    for start in tqdm(range(0, len(pending), batch_size), desc="Inferencia del profesor", colour="green"):
+        batch = [str(p) for p in pending[start:start + batch_size]]
+        results = teacher.predict(source=batch, imgsz=img_size, conf=conf, batch=len(batch), verbose=False)
+        for path, result in zip(batch, results):
+            boxes = result.boxes
+            lines = [
+                f"{cls} {x:.6f} {y:.6f} {w:.6f} {h:.6f} {c:.4f}"
+                for cls, (x, y, w, h), c in zip(boxes.cls.int().tolist(), boxes.xywhn.tolist(), boxes.conf.tolist())
+            ]
+            entries[Path(path)].write_text("\n".join(lines), encoding="utf-8")
+    return entries
+
+
+def merge_labels(gt_boxes, teacher_boxes, pseudo_conf: float, iou_thr: float):
+    """
+    Etiquetas del alumno: las cajas reales más las del profesor con confianza alta que
+    no solapan con ninguna real (primordios que el etiquetado manual pasó por alto).
+    """
+    merged = [b[:5] for b in gt_boxes]
+    for box in teacher_boxes:
+        if box[5] < pseudo_conf:
+            continue
+        if all(xywh_iou(box[1:5], gt[1:5]) < iou_thr for gt in gt_boxes):
+            merged.append(box[:5])
+    return merged
+
+
+@app.command()
+def main(
+    teacher_path: Path = typer.Option(..., "--teacher", help="Pesos del profesor (ej: models/yolov8m_150epochs/weights/best.pt)."),
+    student_name: str = typer.Option("yolov8n", "--student", help="Modelo YOLO base del alumno."),
+    data_yaml_path: Path = typer.Option(Path("data/interim/primordia_split/data.yaml"), "--data", help="data.yaml del dataset original."),
+    extra_images_dir: Path = typer.Option(None, "--extra-images", help="Carpeta opcional de imágenes sin etiquetar que se etiquetan sólo con el profesor."),
+    num_epochs: int = typer.Option(150, "--epochs", help="Número de épocas del alumno."),
+    img_size: int = typer.Option(640, "--imgsz", help="Tamaño de imagen para el profesor y el alumno."),
+    batch_size: int = typer.Option(16, "--batch-size", help="Tamaño del batch (inferencia del profesor y entrenamiento)."),
+    pseudo_conf: float = typer.Option(0.5, "--pseudo-conf", help="Confianza mínima del profesor para añadir una caja al alumno."),
+    iou_thr: float = typer.Option(0.5, "--iou", help="IoU a partir del cual una caja del profesor se considera ya etiquetada."),
+    use_pyramid: bool = typer.Option(True, "--pyramid/--no-pyramid", help="Usar el nivel de la pirámide de imágenes (tools/image_pyramid.py) más cercano a --imgsz, si existe."),
+):
+    """
+    Destilación offline: el profesor etiqueta (una sola vez, con caché) las imágenes de
+    entrenamiento y el alumno se entrena con las etiquetas reales más las del profesor.
+    """
+    if not teacher_path.exists():
+        logger.error(f"No existe el fichero de pesos del profesor: {teacher_path}")
+        raise typer.Exit(code=1)
+    if use_pyramid:
+        # Profesor, alumno y validación leen el mismo nivel reducido
+        data_yaml_path = Path(resolve_data_yaml(data_yaml_path, img_size))
+    with open(data_yaml_path, "r", encoding="utf-8") as f:
+        data_cfg = yaml.safe_load(f)
+    dataset_root = Path(data_cfg.get("path") or data_yaml_path.parent)
+
+    teacher_run = teacher_path.parent.parent.name if teacher_path.parent.name == "weights" else teacher_path.stem
+    experiment_name = f"distill_{student_name}_from_{teacher_run}"
+    run_data_dir = INTERIM_DATA_DIR / "distill" / experiment_name
+    # Las salidas se guardan a partir de esta confianza: con otra --pseudo-conf menor las
+    # cacheadas estarían incompletas, así que forma parte de la clave de la caché
+    teacher_conf = min(pseudo_conf, 0.25)
+    cache_dir = INTERIM_DATA_DIR / "teacher_cache" / f"{file_hash(teacher_path)[:12]}_{img_size}_conf{teacher_conf:g}"
+    logger.info(f"🚀 Destilación {teacher_run} -> {student_name}. Caché del profesor: {cache_dir}")
+
+    if run_data_dir.exists():
+        shutil.rmtree(run_data_dir)
+
+    # --- 1. Imágenes de entrenamiento (etiquetadas y, opcionalmente, sin etiquetar) ---
+    train_img_dir = dataset_root / data_cfg["train"]
+    train_lbl_dir = labels_dir_for(train_img_dir)
+    train_images = sorted(p for p in train_img_dir.glob("*.*") if p.suffix.lower() in IMAGE_EXTENSIONS)
+    extra_images = []
+    if extra_images_dir:
+        extra_images = sorted(p for p in extra_images_dir.rglob("*.*") if p.suffix.lower() in IMAGE_EXTENSIONS)
+    logger.info(f"{len(train_images)} imágenes etiquetadas y {len(extra_images)} sin etiquetar.")
+
+    # --- 2. Salidas del profesor (cacheadas) ---
+    teacher_outputs = cache_teacher_outputs(teacher_path, train_images + extra_images, cache_dir, img_size, batch_size, teacher_conf)
+
+    # --- 3. Dataset del alumno ---
+    img_out, lbl_out = run_data_dir / "images" / "train", run_data_dir / "labels" / "train"
+    img_out.mkdir(parents=True, exist_ok=True)
+    lbl_out.mkdir(parents=True, exist_ok=True)
+    # Las imágenes extra (rglob) pueden repetir nombre entre subcarpetas o con las de
+    # entrenamiento: se renombran con su ruta relativa y no tienen etiquetas reales
+    students = [(p, p.stem, train_lbl_dir / f"{p.stem}.txt") for p in train_images]
+    students += [(p, "extra_" + "_".join(p.relative_to(extra_images_dir).with_suffix("").parts), None) for p in extra_images]
+    added = 0
+    for image_path, out_stem, gt_path in tqdm(students, desc="Generando etiquetas del alumno", leave=False):
+        gt = read_boxes(gt_path) if gt_path else []
+        merged = merge_labels(gt, read_boxes(teacher_outputs[image_path]), pseudo_conf, iou_thr)
+        added += len(merged) - len(gt)
+        link_or_copy(image_path, img_out / f"{out_stem}{image_path.suffix}")
+        lines = [f"{b[0]} {b[1]:.6f} {b[2]:.6f} {b[3]:.6f} {b[4]:.6f}" for b in merged]
+        (lbl_out / f"{out_stem}.txt").write_text("\n".join(lines), encoding="utf-8")
+    logger.info(f"El profesor ha añadido {added} cajas a las etiquetas reales.")
+
+    # La validación sigue usando las etiquetas reales del dataset original
+    yaml_content = {
+        "path": str(run_data_dir.resolve()), "train": "images/train",
+        "val": str((dataset_root / data_cfg["val"]).resolve()),
+        "nc": data_cfg["nc"], "names": data_cfg["names"],
+    }
+    yaml_path = run_data_dir / "data.yaml"
+    with open(yaml_path, "w") as f:
+        yaml.dump(yaml_content, f, sort_keys=False)
+
+    # --- 4. Entrenamiento del alumno ---
+    model = YOLO(f"{student_name}.pt")
+    track(model, source="distill")
+    model.train(
+        data=str(yaml_path.resolve()),
+        epochs=num_epochs,
+        imgsz=img_size,
+        batch=batch_size,
+        project=str(MODELS_DIR.resolve()),
+        name=experiment_name,
+        exist_ok=True,
+    )
+    logger.success(f"✅ Alumno guardado en {MODELS_DIR / experiment_name / 'weights' / 'best.pt'}")
+
+
+if __name__ == "__main__":
+    app()
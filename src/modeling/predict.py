@@ -2,9 +2,85 @@ import typer
 from ultralytics import YOLO
 from pathlib import Path
 from loguru import logger
+import csv
+import sys
+import time
+import torch
+
+# Permite importar los módulos de src/ al ejecutar como script (python src/modeling/...)
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from config import IMAGE_EXTENSIONS  # noqa: E402
+from modeling.boxes import box_iou  # noqa: E402
 
 app = typer.Typer()
 
+
+def needs_escalation(result, band, count_range):
+    """
+    Una imagen se escala al modelo grande si alguna detección tiene una confianza
+    ambigua (dentro de `band`) o si el número de detecciones se sale de `count_range`.
+    """
+    confs = result.boxes.conf.tolist() if result.boxes is not None else []
+    if any(band[0] <= c <= band[1] for c in confs):
+        return True
+    n = sum(1 for c in confs if c > band[1])
+    return not (count_range[0] <= n <= count_range[1])
+
+
+def merge_detections(fast_result, large_result, confident: float, iou_thr: float = 0.5):
+    """
+    Fusiona ambos modelos sobre una imagen escalada: todas las cajas del modelo grande
+    más las del rápido con confianza alta que el grande no ha detectado.
+    """
+    large = large_result.boxes.data.tolist()
+    extra = [
+        box for box in fast_result.boxes.data.tolist()
+        if box[4] > confident and all(box_iou(box, other) < iou_thr for other in large)
+    ]
+    if extra:
+        large_result.update(boxes=torch.tensor(large + extra, device=large_result.boxes.data.device))
+    return large_result
+
+
+def run_cascade(fast_model, large_model, image_paths, output_dir, band, count_range, conf):
+    """Ejecuta la cascada imagen a imagen y guarda predicciones, resumen CSV y tiempos."""
+    output_dir.mkdir(parents=True, exist_ok=True)
+    rows, escalated = [], 0
+    start_total = time.perf_counter()
+    for image_path in image_paths:
+        t0 = time.perf_counter()
+        result = fast_model.predict(source=str(image_path), conf=conf, verbose=False)[0]
+        fast_ms = (time.perf_counter() - t0) * 1000
+
+        large_ms = 0.0
+        escalate = needs_escalation(result, band, count_range)
+        if escalate:
+            escalated += 1
+            t0 = time.perf_counter()
+            large_result = large_model.predict(source=str(image_path), conf=conf, verbose=False)[0]
+            large_ms = (time.perf_counter() - t0) * 1000
+            result = merge_detections(result, large_result, band[1])
+
+        result.save(filename=str(output_dir / f"predicted_{image_path.name}"))
+        rows.append({
+            "image": str(image_path), "escalated": escalate, "n_boxes": len(result.boxes),
+            "fast_ms": round(fast_ms, 2), "large_ms": round(large_ms, 2), "total_ms": round(fast_ms + large_ms, 2),
+        })
+    elapsed = time.perf_counter() - start_total
+
+    with open(output_dir / "cascade_results.csv", "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+
+    n = len(rows)
+    logger.info(f"Imágenes: {n} | Escaladas: {escalated} ({escalated / n:.1%})")
+    logger.info(f"Latencia media por imagen: {sum(r['total_ms'] for r in rows) / n:.1f} ms "
+                f"(rápido {sum(r['fast_ms'] for r in rows) / n:.1f} ms, "
+                f"grande {sum(r['large_ms'] for r in rows) / max(escalated, 1):.1f} ms por imagen escalada)")
+    logger.info(f"Tiempo total extremo a extremo: {elapsed:.1f} s ({n / elapsed:.2f} imágenes/s)")
+    logger.info(f"Resultados por imagen guardados en: {output_dir / 'cascade_results.csv'}")
+
 @app.command()
 def predict(
     weights_path: Path = typer.Option(
@@ -21,7 +97,15 @@ def predict(
         "reports/figures/", 
         "--output-dir", 
         help="Directorio donde se guardarán las imágenes con las predicciones."
-    )
+    ),
+    escalate_weights: Path = typer.Option(
+        None,
+        "--escalate-weights",
+        help="Modo cascada: pesos de un modelo más grande al que se escalan las imágenes dudosas (--weights-path es el modelo rápido)."
+    ),
+    band: str = typer.Option("0.25,0.6", "--band", help="Cascada: banda de confianza 'baja,alta' que se considera ambigua."),
+    count_range: str = typer.Option("0,100", "--count-range", help="Cascada: número 'mín,máx' de detecciones esperado; fuera de él se escala."),
+    conf: float = typer.Option(0.25, "--conf", help="Cascada: confianza mínima de las detecciones."),
 ):
     """
     Usa un modelo YOLO entrenado para hacer una predicción sobre una nueva imagen,
@@ -39,6 +123,24 @@ def predict(
         logger.error("La ruta de entrada especificada no existe.")
         raise typer.Exit(code=1)
 
+    if escalate_weights:
+        if not escalate_weights.exists():
+            logger.error("El fichero de pesos del modelo grande no existe.")
+            raise typer.Exit(code=1)
+        if input_path.is_dir():
+            image_paths = sorted(p for p in input_path.rglob("*.*") if p.suffix.lower() in IMAGE_EXTENSIONS)
+        else:
+            image_paths = [input_path]
+        if not image_paths:
+            logger.error("No se encontraron imágenes en la ruta de entrada.")
+            raise typer.Exit(code=1)
+        logger.info(f"Modo cascada: {weights_path.name} -> {escalate_weights}")
+        band_values = [float(x) for x in band.split(",")]
+        count_values = [int(x) for x in count_range.split(",")]
+        run_cascade(model, YOLO(escalate_weights), image_paths, output_dir, band_values, count_values, conf)
+        logger.success("✅ Predicción en cascada completada.")
+        return
+
     # Realizar la predicción
     results = model.predict(source=str(input_path))
     
@@ -0,0 +1,190 @@
+import typer
+from pathlib import Path
+import copy
+import csv
+import sys
+import time
+import matplotlib
+import torch
+import yaml
+from loguru import logger
+from ultralytics import YOLO
+from ultralytics.models.yolo.detect import DetectionTrainer
+from ultralytics.nn.modules import Detect
+
+from pruned_layers import make_prunable
+
+try:
+    import torch_pruning as tp
+except ModuleNotFoundError:
+    tp = None
+
+# Permite importar los módulos de src/ al ejecutar como script (python src/modeling/...)
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from config import FIGURES_DIR, IMAGE_EXTENSIONS, MODELS_DIR  # noqa: E402
+from tools.image_pyramid import resolve_data_yaml  # noqa: E402
+
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt  # noqa: E402
+
+app = typer.Typer()
+
+
+class PrunedDetectionTrainer(DetectionTrainer):
+    """
+    El entrenador por defecto reconstruye el modelo desde su YAML y copia los pesos, lo
+    que deshace la poda. Este devuelve directamente el modelo podado.
+    """
+    pruned_model = None
+
+    def get_model(self, cfg=None, weights=None, verbose=True):
+        model = self.pruned_model
+        for p in model.parameters():
+            p.requires_grad = True
+        return model
+
+
+def count_macs(model, img_size):
+    example = torch.randn(1, 3, img_size, img_size)
+    macs, params = tp.utils.count_ops_and_params(model, example)
+    return macs, params
+
+
+def prune_to_target(model, img_size, flop_reduction, steps=20):
+    """
+    Poda estructurada por magnitud (L2) de canales, de forma iterativa, hasta reducir
+    los MACs en `flop_reduction`. La cabeza Detect no se poda para conservar las salidas.
+    """
+    model = make_prunable(copy.deepcopy(model)).train()
+    for p in model.parameters():
+        p.requires_grad = True
+    example = torch.randn(1, 3, img_size, img_size)
+    base_macs, _ = count_macs(model, img_size)
+
+    pruner = tp.pruner.MagnitudePruner(
+        model,
+        example,
+        importance=tp.importance.MagnitudeImportance(p=2),
+        iterative_steps=steps,
+        pruning_ratio=min(0.9, flop_reduction * 1.5),  # Cota superior; se para al llegar al objetivo
+        ignored_layers=[m for m in model.modules() if isinstance(m, Detect)],
+    )
+    macs = base_macs
+    for _ in range(steps):
+        pruner.step()
+        macs, _ = count_macs(model, img_size)
+        if macs <= base_macs * (1 - flop_reduction):
+            break
+    logger.info(f"MACs: {base_macs / 1e9:.2f}G -> {macs / 1e9:.2f}G ({1 - macs / base_macs:.1%} menos)")
+    return model, macs
+
+
+def measure_latency(model: YOLO, images, img_size, warmup=3):
+    """Latencia media por imagen en CPU (ms)."""
+    for path in images[:warmup]:
+        model.predict(source=str(path), imgsz=img_size, device="cpu", verbose=False)
+    start = time.perf_counter()
+    for path in images:
+        model.predict(source=str(path), imgsz=img_size, device="cpu", verbose=False)
+    return (time.perf_counter() - start) / max(len(images), 1) * 1000
+
+
+@app.command()
+def main(
+    weights_path: Path = typer.Option(..., "--weights-path", help="Pesos a podar (ej: models/yolov8m_150epochs/weights/best.pt)."),
+    data_yaml_path: Path = typer.Option(Path("data/interim/primordia_split/data.yaml"), "--data", help="data.yaml para el ajuste fino y la validación."),
+    targets: str = typer.Option("0.25,0.5", "--targets", help="Reducciones de FLOPs a probar, separadas por comas (ej. 0.25 = 25% menos)."),
+    num_epochs: int = typer.Option(10, "--epochs", help="Épocas de ajuste fino tras la poda."),
+    img_size: int = typer.Option(640, "--imgsz", help="Tamaño de imagen."),
+    latency_images: int = typer.Option(20, "--latency-images", help="Imágenes de validación usadas para medir la latencia en CPU."),
+    export_format: str = typer.Option("onnx", "--export-format", help="Formato de exportación del modelo podado (onnx, torchscript, openvino...)."),
+):
+    """
+    Poda estructurada de canales hasta una reducción de FLOPs objetivo, ajuste fino corto,
+    exportación del modelo reducido e informe de la curva precisión/latencia.
+    """
+    if tp is None:
+        logger.error("Este comando necesita 'torch-pruning' (pip install torch-pruning).")
+        raise typer.Exit(code=1)
+    if not weights_path.exists():
+        logger.error("El fichero de pesos especificado no existe.")
+        raise typer.Exit(code=1)
+
+    run_name = weights_path.parent.parent.name if weights_path.parent.name == "weights" else weights_path.stem
+    with open(data_yaml_path, "r", encoding="utf-8") as f:
+        data_cfg = yaml.safe_load(f)
+    dataset_root = Path(data_cfg.get("path") or data_yaml_path.parent)
+    val_dir = dataset_root / data_cfg["val"]
+    sample = sorted(p for p in val_dir.glob("*.*") if p.suffix.lower() in IMAGE_EXTENSIONS)[:latency_images]
+    # Entrenamiento y validación sobre la pirámide; la latencia sobre los originales
+    train_data = resolve_data_yaml(data_yaml_path, img_size)
+
+    # --- 1. Referencia sin podar ---
+    base = YOLO(weights_path)
+    base_macs, base_params = count_macs(copy.deepcopy(base.model), img_size)
+    metrics = base.val(data=train_data, imgsz=img_size, plots=False)
+    rows = [{
+        "target": 0.0, "macs_g": base_macs / 1e9, "params_m": base_params / 1e6,
+        "map50": metrics.box.map50, "map50_95": metrics.box.map,
+        "latency_ms": 0.0, "weights": str(weights_path),
+    }]
+    # La latencia se mide siempre sobre el modelo exportado, para comparar en igualdad
+    base_exported = base.export(format=export_format, imgsz=img_size)
+    rows[0]["latency_ms"] = measure_latency(YOLO(base_exported, task="detect"), sample, img_size)
+
+    # --- 2. Poda + ajuste fino por cada objetivo ---
+    for target in [float(t) for t in targets.split(",")]:
+        experiment_name = f"{run_name}_pruned{int(target * 100)}"
+        logger.info(f"--- Podando {run_name} al {target:.0%} menos de FLOPs: {experiment_name} ---")
+        # Se parte de una carga limpia: val() fusiona conv+bn en el modelo que recibe
+        pruned, macs = prune_to_target(YOLO(weights_path).model, img_size, target)
+        params = sum(p.numel() for p in pruned.parameters())
+
+        PrunedDetectionTrainer.pruned_model = pruned
+        model = YOLO(weights_path)
+        model.train(
+            trainer=PrunedDetectionTrainer,
+            data=train_data,
+            epochs=num_epochs,
+            imgsz=img_size,
+            project=str(MODELS_DIR.resolve()),
+            name=experiment_name,
+            exist_ok=True,
+        )
+
+        best = MODELS_DIR / experiment_name / "weights" / "best.pt"
+        finetuned = YOLO(best)
+        metrics = finetuned.val(data=train_data, imgsz=img_size, plots=False)
+        exported = finetuned.export(format=export_format, imgsz=img_size)
+        rows.append({
+            "target": target, "macs_g": macs / 1e9, "params_m": params / 1e6,
+            "map50": metrics.box.map50, "map50_95": metrics.box.map,
+            "latency_ms": measure_latency(YOLO(exported, task="detect"), sample, img_size), "weights": str(exported),
+        })
+        logger.success(f"✅ {experiment_name}: mAP50={rows[-1]['map50']:.3f}, latencia={rows[-1]['latency_ms']:.1f} ms")
+
+    # --- 3. Informe de la curva precisión/latencia ---
+    FIGURES_DIR.mkdir(parents=True, exist_ok=True)
+    report_path = MODELS_DIR / f"{run_name}_pruning.csv"
+    with open(report_path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+
+    fig, ax = plt.subplots(figsize=(6, 4))
+    ax.plot([r["latency_ms"] for r in rows], [r["map50"] for r in rows], marker="o")
+    for r in rows:
+        ax.annotate(f"-{r['target']:.0%}", (r["latency_ms"], r["map50"]))
+    ax.set_xlabel("Latencia CPU (ms/imagen)")
+    ax.set_ylabel("mAP50")
+    ax.set_title(f"Poda de {run_name}")
+    fig.tight_layout()
+    fig.savefig(FIGURES_DIR / f"{run_name}_pruning.png")
+
+    for r in rows:
+        logger.info(f"-{r['target']:.0%} FLOPs | {r['macs_g']:.2f} GMACs | mAP50={r['map50']:.3f} | {r['latency_ms']:.1f} ms | {r['weights']}")
+    logger.success(f"✅ Informe guardado en {report_path}")
+
+
+if __name__ == "__main__":
+    app()
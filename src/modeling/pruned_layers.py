@@ -0,0 +1,62 @@
+"""
+Capas auxiliares para la poda estructurada de modelos YOLOv8.
+
+Este módulo se importa por nombre al cargar un `best.pt` podado, así que debe seguir
+siendo importable desde src/modeling (donde se ejecutan predict.py y el resto de scripts).
+"""
+import copy
+
+import torch
+from torch import nn
+from ultralytics.nn.modules import C2f
+
+
+def _slice_conv(conv, start, end):
+    """Copia de un bloque Conv (conv + bn + act) quedándose con los canales de salida [start, end)."""
+    new = copy.deepcopy(conv)
+    new.conv.weight = nn.Parameter(conv.conv.weight.data[start:end].clone())
+    new.conv.out_channels = end - start
+    if conv.conv.bias is not None:
+        new.conv.bias = nn.Parameter(conv.conv.bias.data[start:end].clone())
+    if hasattr(conv, "bn"):
+        bn = new.bn
+        bn.weight = nn.Parameter(conv.bn.weight.data[start:end].clone())
+        bn.bias = nn.Parameter(conv.bn.bias.data[start:end].clone())
+        bn.running_mean = conv.bn.running_mean[start:end].clone()
+        bn.running_var = conv.bn.running_var[start:end].clone()
+        bn.num_features = end - start
+    return new
+
+
+class C2fPrunable(nn.Module):
+    """
+    Equivalente a C2f, pero con la primera convolución separada en dos (cv0 y cv1) en
+    lugar de `chunk(2, 1)`. Así cada mitad puede perder canales de forma independiente.
+    """
+
+    def __init__(self, c2f: C2f):
+        super().__init__()
+        self.c = c2f.c
+        self.cv0 = _slice_conv(c2f.cv1, 0, self.c)
+        self.cv1 = _slice_conv(c2f.cv1, self.c, 2 * self.c)
+        self.cv2 = c2f.cv2
+        self.m = c2f.m
+        # Atributos que DetectionModel usa para recorrer el grafo
+        for attr in ("f", "i", "type", "np"):
+            if hasattr(c2f, attr):
+                setattr(self, attr, getattr(c2f, attr))
+
+    def forward(self, x):
+        y = [self.cv0(x), self.cv1(x)]
+        y.extend(m(y[-1]) for m in self.m)
+        return self.cv2(torch.cat(y, 1))
+
+
+def make_prunable(module: nn.Module):
+    """Sustituye (in-place) todos los C2f del modelo por C2fPrunable."""
+    for name, child in module.named_children():
+        if type(child) is C2f:
+            setattr(module, name, C2fPrunable(child))
+        else:
+            make_prunable(child)
+    return module
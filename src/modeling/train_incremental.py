@@ -7,6 +7,7 @@ import shutil
 from collections import defaultdict
 from ultralytics import YOLO
 import yaml
+import sys
 from loguru import logger
 
 # Asumiendo que las rutas se importan desde un src/config.py centralizado
@@ -26,6 +27,11 @@ MODELS_DIR = PROJ_ROOT / "models"
 REPORTS_DIR = PROJ_ROOT / "reports"
 FIGURES_DIR = REPORTS_DIR / "figures"
 
+# Permite importar los módulos de src/ al ejecutar como script (python src/modeling/...)
+sys.path.insert(0, str(PROJ_ROOT / "src"))
+from tools.run_registry import track  # noqa: E402
+from modeling.tune_resources import resolve_resources  # noqa: E402
+
 app = typer.Typer()
 
 def get_day_of_cultivation(json_path: Path) -> int:
@@ -41,7 +47,8 @@ def main(
     model_base_name: str = typer.Option("yolov8m", "--model", help="Modelo YOLO base para el primer entrenamiento."),
     num_epochs: int = typer.Option(50, "--epochs", help="Número de épocas para cada paso de entrenamiento."),
     img_size: int = typer.Option(640, "--imgsz", help="Tamaño de imagen para el entrenamiento."),
-    batch_size: int = typer.Option(8, "--batch-size", help="Tamaño del batch para el entrenamiento. ¡Redúcelo si te quedas sin memoria!"),
+    batch_size: int = typer.Option(None, "--batch-size", help="Tamaño del batch. Por defecto, el del perfil de tune_resources.py u 8."),
+    workers: int = typer.Option(None, "--workers", help="Workers del dataloader. Por defecto, los del perfil de tune_resources.py u 8."),
     use_amp: bool = typer.Option(True, "--amp/--no-amp", help="Usar Automatic Mixed Precision (AMP) para ahorrar memoria."),
     data_subdir: str = typer.Option("primordia", help="Subdirectorio en data/raw que contiene los datos."),
 ):
@@ -49,6 +56,7 @@ def main(
     Realiza un entrenamiento incremental día a día.
     """
     logger.info("🚀 Iniciando orquestador de entrenamiento temporal incremental.")
+    batch_size, workers = resolve_resources(model_base_name, img_size, batch_size, workers, default_batch=8)
     
     logger.info("Mapeando imágenes a sus días de cultivo...")
     raw_images_dir = RAW_DATA_DIR / data_subdir / "images"
@@ -110,6 +118,8 @@ def main(
         for file_pair in files_by_day[validation_day]:
             shutil.copy(file_pair["image"], val_img_dir)
             shutil.copy(file_pair["label"], val_lbl_dir)
+        # Este dataset se regenera en cada iteración, así que no pasa por la pirámide de
+        # imágenes (tools/image_pyramid.py) como train_ultralytics.py
         yaml_path = run_data_dir / "data.yaml"
         yaml_content = {
             'path': str(run_data_dir.resolve()), 'train': 'images/train', 'val': 'images/val',
@@ -120,14 +130,16 @@ def main(
 
         # --- 4. Entrenamiento Incremental ---
         model = YOLO(last_model_weights)
+        track(model, source="train_incremental")
         
-        logger.info(f"Entrenando con pesos de: {last_model_weights}, batch_size={batch_size}, imgsz={img_size}, amp={use_amp}")
+        logger.info(f"Entrenando con pesos de: {last_model_weights}, batch_size={batch_size}, workers={workers}, imgsz={img_size}, amp={use_amp}")
         # --- LLAMADA A TRAIN ACTUALIZADA ---
         model.train(
             data=str(yaml_path.resolve()),
             epochs=num_epochs,
             imgsz=img_size,
             batch=batch_size, # Pasamos el batch size
+            workers=workers,
             amp=use_amp,      # Activamos o desactivamos AMP
             project=str(MODELS_DIR.resolve()),
             name=experiment_name,
@@ -1,43 +1,98 @@
 import typer
+import shutil
+import sys
+from pathlib import Path
+from typing import List
+import yaml
 from ultralytics import YOLO
 
+# Permite importar los módulos de src/ al ejecutar como script (python src/modeling/...)
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from tools.run_registry import track  # noqa: E402
+from modeling.tune_resources import resolve_resources  # noqa: E402
+from tools.image_pyramid import resolve_data_yaml  # noqa: E402
+
 app = typer.Typer()
 
+
+def parse_overrides(overrides: List[str]) -> dict:
+    """Convierte ['mosaic=0.5', 'fliplr=0'] en {'mosaic': 0.5, 'fliplr': 0} (valores YAML)."""
+    parsed = {}
+    for item in overrides or []:
+        key, _, value = item.partition("=")
+        parsed[key.strip()] = yaml.safe_load(value)
+    return parsed
+
+
+def pause_at_epoch(stop_at_epoch: int):
+    """
+    Callback que detiene el entrenamiento al terminar la época `stop_at_epoch`, guardando
+    antes una copia de last.pt ('resume.pt') con el optimizador, porque al terminar
+    Ultralytics elimina el optimizador de last.pt y ya no se podría reanudar.
+    """
+    def callback(trainer):
+        if trainer.epoch + 1 >= stop_at_epoch:
+            shutil.copy(trainer.last, Path(trainer.wdir) / "resume.pt")
+            trainer.stop = True
+    return callback
+
+
 @app.command()
 def main(
-    # Mantenemos solo estos dos parámetros configurables
     model_base_name: str = typer.Option(
-        "yolov8n", 
-        "--model", 
+        "yolov8n",
+        "--model",
         help="Nombre base del modelo YOLO a usar (ej: yolov8n, yolov8s)."
     ),
     num_epochs: int = typer.Option(
-        150, 
-        "--epochs", 
+        150,
+        "--epochs",
         help="Número de épocas para el entrenamiento."
-    )
+    ),
+    img_size: int = typer.Option(640, "--imgsz", help="Tamaño de imagen para el entrenamiento."),
+    batch_size: int = typer.Option(None, "--batch-size", help="Tamaño del batch. Por defecto, el del perfil de tune_resources.py o 16."),
+    workers: int = typer.Option(None, "--workers", help="Workers del dataloader. Por defecto, los del perfil de tune_resources.py u 8."),
+    data_yaml_path: str = typer.Option('./data/interim/primordia_split/data.yaml', "--data", help="Ruta al data.yaml del dataset."),
+    use_pyramid: bool = typer.Option(True, "--pyramid/--no-pyramid", help="Usar el nivel de la pirámide de imágenes (tools/image_pyramid.py) más cercano a --imgsz, si existe."),
+    experiment_name: str = typer.Option(None, "--name", help="Nombre del experimento. Por defecto '<modelo>_<épocas>epochs'."),
+    overrides: List[str] = typer.Option(None, "--set", help="Hiperparámetros extra de Ultralytics como clave=valor (ej: --set mosaic=0.5). Repetible."),
+    stop_at_epoch: int = typer.Option(None, "--stop-at-epoch", help="Pausar el entrenamiento al terminar esta época (el calendario de LR sigue siendo el de --epochs)."),
+    resume_from: Path = typer.Option(None, "--resume-from", help="Reanudar desde un 'resume.pt' guardado con --stop-at-epoch."),
 ):
     """ data_yaml_path = './data/processed/final_dataset/data.yaml' """
-    data_yaml_path = './data/interim/primordia_split/data.yaml'
-    img_size = 640
-    experiment_name = f"{model_base_name}_{num_epochs}epochs"
-    model = YOLO(f"{model_base_name}.pt")
+    experiment_name = experiment_name or f"{model_base_name}_{num_epochs}epochs"
+    model = YOLO(resume_from if resume_from else f"{model_base_name}.pt")
+    track(model, source="train_ultralytics")
+    if stop_at_epoch:
+        model.add_callback("on_model_save", pause_at_epoch(stop_at_epoch))
+
+    if resume_from:
+        typer.echo(f"🔁 Reanudando '{experiment_name}' desde {resume_from}...")
+        model.train(resume=str(resume_from))
+        typer.secho("✅ Entrenamiento finalizado con éxito.", fg=typer.colors.GREEN)
+        return
 
     # --- 4. Entrenamiento del Modelo ---
     typer.echo(f"🚀 Iniciando entrenamiento del modelo '{model_base_name}' por {num_epochs} épocas...")
     typer.echo(f"Los resultados se guardarán en: models/{experiment_name}")
 
+    if use_pyramid:
+        data_yaml_path = resolve_data_yaml(data_yaml_path, img_size)
+    batch_size, workers = resolve_resources(model_base_name, img_size, batch_size, workers, default_batch=16)
     model.train(
-        data=data_yaml_path,  # Usa la variable fija
+        data=data_yaml_path,
         epochs=num_epochs,
-        imgsz=img_size,      # Usa la variable fija
+        imgsz=img_size,
+        batch=batch_size,
+        workers=workers,
         project='models',
         name=experiment_name,
-        exist_ok=True
+        exist_ok=True,
+        **parse_overrides(overrides),
     )
-    
+
     typer.secho("✅ Entrenamiento finalizado con éxito.", fg=typer.colors.GREEN)
 
 # Punto de entrada para ejecutar la aplicación
 if __name__ == "__main__":
-    app()
\ No newline at end of file
+    app()
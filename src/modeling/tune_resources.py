@@ -0,0 +1,245 @@
+"""
+Ajuste automático de batch size y workers del dataloader para la máquina actual.
+
+Cada prueba es un entrenamiento de Ultralytics de unos pocos pasos lanzado en un proceso
+aparte, así que si se queda sin memoria sólo muere la prueba. Mientras corre se mide la
+RAM de todo el árbol de procesos (entrenador + workers del dataloader) y se mata si pasa
+del presupuesto. Los valores elegidos se guardan como perfil en
+models/resource_profile.json, que train_ultralytics.py y train_incremental.py leen cuando
+no se les pasa --batch-size / --workers.
+"""
+from datetime import datetime
+import json
+import os
+from pathlib import Path
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+from loguru import logger
+import psutil
+import typer
+
+PROJ_ROOT = Path(__file__).resolve().parents[2]
+PROFILE_PATH = PROJ_ROOT / "models" / "resource_profile.json"
+RESULT_PREFIX = "PROBE_RESULT "
+
+app = typer.Typer()
+
+
+# --- Perfil ---
+def profile_key(model: str, imgsz: int) -> str:
+    return f"{Path(model).stem}@{imgsz}"
+
+
+def load_profile(model: str, imgsz: int, path: Path = PROFILE_PATH) -> dict | None:
+    """Perfil guardado para este modelo e imgsz en esta máquina, o None si no hay."""
+    if not path.exists():
+        return None
+    with open(path, encoding="utf-8") as f:
+        profiles = json.load(f)
+    profile = profiles.get(profile_key(model, imgsz))
+    if profile is None or profile.get("host") != socket.gethostname():
+        return None
+    return profile
+
+
+def save_profile(model: str, imgsz: int, profile: dict, path: Path = PROFILE_PATH):
+    profiles = {}
+    if path.exists():
+        with open(path, encoding="utf-8") as f:
+            profiles = json.load(f)
+    profiles[profile_key(model, imgsz)] = profile
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(profiles, f, indent=2)
+
+
+def resolve_resources(model: str, imgsz: int, batch_size: int | None, workers: int | None,
+                      default_batch: int, default_workers: int = 8):
+    """Valores explícitos > perfil guardado > valores por defecto. Devuelve (batch, workers)."""
+    profile = load_profile(model, imgsz) or {}
+    if profile and (batch_size is None or workers is None):
+        logger.info(f"Usando el perfil de recursos {profile_key(model, imgsz)}: batch={profile['batch']}, workers={profile['workers']}")
+    batch = batch_size if batch_size is not None else profile.get("batch", default_batch)
+    workers = workers if workers is not None else profile.get("workers", default_workers)
+    return batch, workers
+
+
+# --- Pruebas ---
+class ProbeFinished(Exception):
+    pass
+
+
+@app.command(hidden=True)
+def probe(
+    model_name: str = typer.Option(..., "--model"),
+    data: str = typer.Option(..., "--data"),
+    imgsz: int = typer.Option(..., "--imgsz"),
+    batch: int = typer.Option(..., "--batch"),
+    workers: int = typer.Option(..., "--workers"),
+    warmup: int = typer.Option(3, "--warmup"),
+    steps: int = typer.Option(10, "--steps"),
+    project: str = typer.Option(..., "--project"),
+):
+    """Entrena `warmup + steps` batches y escribe las imágenes/s medidas (uso interno)."""
+    from ultralytics import YOLO
+
+    state = {"n": 0, "t0": None}
+
+    def report():
+        measured = state["n"] - warmup
+        if state["t0"] is not None and measured > 0:
+            elapsed = time.perf_counter() - state["t0"]
+            print(RESULT_PREFIX + json.dumps({"images_per_sec": measured * batch / elapsed}), flush=True)
+
+    def on_batch_end(trainer):
+        state["n"] += 1
+        if state["n"] == warmup:
+            state["t0"] = time.perf_counter()
+        if state["n"] >= warmup + steps:
+            report()
+            raise ProbeFinished
+
+    model = YOLO(f"{model_name}.pt")
+    model.add_callback("on_train_batch_end", on_batch_end)
+    model.add_callback("on_train_epoch_end", lambda trainer: report())  # Dataset más corto que la prueba
+    try:
+        model.train(data=data, epochs=1, imgsz=imgsz, batch=batch, workers=workers, val=False,
+                    plots=False, project=project, name="probe", exist_ok=True, verbose=False)
+    except ProbeFinished:
+        pass
+
+
+def tree_rss(process: psutil.Process) -> int:
+    total = 0
+    for p in [process] + process.children(recursive=True):
+        try:
+            total += p.memory_info().rss
+        except psutil.NoSuchProcess:
+            pass
+    return total
+
+
+def run_probe(model: str, data: str, imgsz: int, batch: int, workers: int, budget_bytes: int,
+              warmup: int, steps: int, timeout: float) -> dict:
+    """Lanza una prueba y devuelve {'fits', 'peak_gb', 'images_per_sec'}."""
+    with tempfile.TemporaryDirectory() as project:
+        command = [
+            sys.executable, __file__, "probe", "--model", model, "--data", data, "--imgsz", str(imgsz),
+            "--batch", str(batch), "--workers", str(workers), "--warmup", str(warmup),
+            "--steps", str(steps), "--project", project,
+        ]
+        stdout = open(Path(project) / "stdout.txt", "w+", encoding="utf-8")
+        process = subprocess.Popen(command, stdout=stdout, stderr=subprocess.STDOUT, text=True)
+        watched = psutil.Process(process.pid)
+        peak, start, reason = 0, time.monotonic(), None
+        while process.poll() is None:
+            peak = max(peak, tree_rss(watched))
+            if peak > budget_bytes:
+                reason = "supera el presupuesto de RAM"
+            elif time.monotonic() - start > timeout:
+                reason = "tiempo agotado"
+            if reason:
+                for p in watched.children(recursive=True) + [watched]:
+                    try:
+                        p.kill()
+                    except psutil.NoSuchProcess:
+                        pass
+                process.wait()
+                break
+            time.sleep(0.2)
+
+        stdout.seek(0)
+        output = stdout.read()
+        stdout.close()
+
+    result = {"fits": False, "peak_gb": round(peak / 1024**3, 2), "images_per_sec": None}
+    lines = [line for line in output.splitlines() if line.startswith(RESULT_PREFIX)]
+    if reason is None and lines:
+        result.update(fits=True, **json.loads(lines[-1][len(RESULT_PREFIX):]))
+    elif reason is None:
+        reason = f"falló (código {process.returncode})"  # p. ej. CUDA out of memory
+        logger.debug(output[-2000:])
+    status = f"{result['images_per_sec']:.1f} img/s" if result["fits"] else reason
+    logger.info(f"batch={batch:<4} workers={workers:<3} pico={result['peak_gb']:.2f} GB -> {status}")
+    return result
+
+
+@app.command()
+def tune(
+    model: str = typer.Option("yolov8n", "--model", help="Modelo YOLO a ajustar (ej: yolov8n, yolov8m)."),
+    data: str = typer.Option("./data/interim/primordia_split/data.yaml", "--data", help="Ruta al data.yaml del dataset."),
+    imgsz: int = typer.Option(640, "--imgsz", help="Tamaño de imagen del entrenamiento."),
+    ram_budget_gb: float = typer.Option(None, "--ram-budget-gb", help="RAM máxima para el entrenamiento. Por defecto, el 80% de la disponible."),
+    headroom: float = typer.Option(0.1, "--headroom", help="Margen sobre el pico medido (las pruebas son cortas y el pico real suele ser algo mayor)."),
+    min_batch: int = typer.Option(2, "--min-batch", help="Batch inicial de la búsqueda."),
+    max_batch: int = typer.Option(128, "--max-batch", help="Batch máximo a probar."),
+    warmup: int = typer.Option(3, "--warmup", help="Batches de calentamiento que no se miden."),
+    steps: int = typer.Option(10, "--steps", help="Batches medidos en cada prueba."),
+    saturation: float = typer.Option(0.95, "--saturation", help="Se eligen los menos workers que den al menos esta fracción del mejor rendimiento."),
+    timeout: float = typer.Option(600, "--timeout", help="Segundos máximos por prueba."),
+):
+    """
+    Busca el mayor batch size que cabe en el presupuesto de RAM y el número de workers del
+    dataloader a partir del cual la CPU ya no da más, y los guarda como perfil.
+    """
+    budget_gb = ram_budget_gb or round(psutil.virtual_memory().available * 0.8 / 1024**3, 1)
+    limit = int(budget_gb * (1 - headroom) * 1024**3)
+    cpus = os.cpu_count() or 1
+    probe_workers = min(8, cpus)  # Valor por defecto de Ultralytics
+    logger.info(f"🔧 Ajustando {model} a imgsz={imgsz} con {budget_gb} GB de RAM y {cpus} CPUs")
+
+    def fits(batch, workers):
+        return run_probe(model, data, imgsz, batch, workers, limit, warmup, steps, timeout)
+
+    # --- 1. Batch: se duplica hasta que no cabe y luego búsqueda binaria ---
+    best, lo, hi = None, None, None
+    batch = min_batch
+    while batch <= max_batch:
+        result = fits(batch, probe_workers)
+        if not result["fits"]:
+            hi = batch
+            break
+        best, lo = result, batch
+        batch *= 2
+    if lo is None:
+        logger.error(f"Ni siquiera batch={min_batch} cabe en {budget_gb} GB. Prueba con un imgsz o modelo menores.")
+        raise typer.Exit(code=1)
+    while hi is not None and hi - lo > max(1, lo // 8):
+        mid = (lo + hi) // 2
+        result = fits(mid, probe_workers)
+        if result["fits"]:
+            best, lo = result, mid
+        else:
+            hi = mid
+    batch = lo
+
+    # --- 2. Workers: el mínimo que satura la CPU con ese batch ---
+    candidates = sorted({0, 1, 2, 4, 8, 16, cpus} & set(range(cpus + 1)))
+    throughput = {probe_workers: best}
+    for workers in candidates:
+        if workers not in throughput:
+            throughput[workers] = fits(batch, workers)
+    valid = {w: r for w, r in throughput.items() if r["fits"]}
+    top = max(r["images_per_sec"] for r in valid.values())
+    workers = min(w for w, r in valid.items() if r["images_per_sec"] >= saturation * top)
+
+    profile = {
+        "host": socket.gethostname(),
+        "batch": batch,
+        "workers": workers,
+        "imgsz": imgsz,
+        "ram_budget_gb": budget_gb,
+        "peak_gb": valid[workers]["peak_gb"],
+        "images_per_sec": round(valid[workers]["images_per_sec"], 1),
+        "created": datetime.now().isoformat(timespec="seconds"),
+    }
+    save_profile(model, imgsz, profile)
+    logger.success(f"✅ Perfil {profile_key(model, imgsz)}: batch={batch}, workers={workers} ({profile['images_per_sec']} img/s). Guardado en {PROFILE_PATH}")
+
+
+if __name__ == "__main__":
+    app()
@@ -0,0 +1,298 @@
+import typer
+from pathlib import Path
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+import json
+import sqlite3
+import sys
+import time
+from loguru import logger
+
+# Permite importar los módulos de src/ al ejecutar como script (python src/modeling/...)
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from config import IMAGE_EXTENSIONS  # noqa: E402
+from tools.calcular_dia_cultivo import calcular_dia_cultivo_desde_json  # noqa: E402
+from tools.dedup import file_hash  # noqa: E402
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    sha1 TEXT PRIMARY KEY,
+    image_path TEXT,
+    metadata_path TEXT,
+    day INTEGER,
+    status TEXT,
+    attempts INTEGER,
+    n_boxes INTEGER,
+    boxes_json TEXT,
+    model TEXT,
+    error TEXT,
+    processed_at TEXT
+);
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    size INTEGER,
+    mtime REAL,
+    sha1 TEXT
+);
+"""
+
+app = typer.Typer()
+
+# --- Worker de inferencia (un modelo por proceso) ---
+_model = None
+
+
+def _init_worker(weights_path: str):
+    global _model
+    from ultralytics import YOLO
+
+    _model = YOLO(weights_path)
+
+
+def _infer_batch(image_paths: list[str], conf: float) -> list[list[list[float]]]:
+    """Devuelve, por imagen, las cajas [x1, y1, x2, y2, conf, clase]."""
+    results = _model.predict(source=image_paths, conf=conf, batch=len(image_paths), verbose=False)
+    return [r.boxes.data.tolist() for r in results]
+
+
+class FolderPipeline:
+    """
+    Ingesta -> inferencia -> resultados sobre una carpeta de entrada.
+
+    - Un escáner sondea la carpeta y encola las imágenes cuyo tamaño ya no cambia (copia
+      terminada) y que tienen su JSON de metadatos (o llevan esperando más de
+      `json_timeout` segundos). La cola está acotada: si la inferencia va por detrás, el
+      escáner se bloquea en lugar de acumular memoria (backpressure).
+    - El consumidor agrupa hasta `batch_size` imágenes (o lo que haya tras `batch_wait`
+      segundos) y las infiere en un pool de procesos.
+    - Los resultados se guardan en SQLite con el SHA-1 del fichero como clave, así que una
+      imagen ya procesada (aunque cambie de nombre o se vuelva a copiar) no se repite.
+      El SHA-1 de cada fichero se guarda con su tamaño y mtime (tabla files), así que las
+      imágenes que se quedan en la carpeta no se vuelven a leer en cada sondeo.
+    - Los lotes fallidos se reintentan con espera exponencial hasta `max_retries` veces;
+      después la imagen queda como 'failed' y no se vuelve a intentar hasta que el fichero
+      cambie o se reinicie el demonio.
+    """
+
+    def __init__(self, drop_dir, metadata_dir, db_path, weights_path, workers, batch_size, batch_wait,
+                 queue_size, poll_interval, json_timeout, max_retries, conf):
+        self.drop_dir, self.metadata_dir = drop_dir, metadata_dir
+        self.weights_path = weights_path
+        self.batch_size, self.batch_wait = batch_size, batch_wait
+        self.poll_interval, self.json_timeout = poll_interval, json_timeout
+        self.max_retries, self.conf = max_retries, conf
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.workers = workers
+        self.pool = self.new_pool()
+        self.inflight = asyncio.Semaphore(workers)
+        self.db = sqlite3.connect(db_path)
+        self.db.executescript(SCHEMA)
+        self.seen_sizes = {}    # ruta -> (tamaño, primera vez visto), sólo mientras se copia
+        self.pending = set()    # rutas encoladas o en inferencia
+        self.pending_hashes = set()
+        self.failed = {}        # ruta -> (tamaño, mtime) de las fallidas en esta ejecución
+        self.tasks = set()
+
+    def new_pool(self):
+        return ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker, initargs=(str(self.weights_path),))
+
+    # --- Almacén ---
+    def is_done(self, sha1: str) -> bool:
+        row = self.db.execute("SELECT status, attempts FROM results WHERE sha1 = ?", (sha1,)).fetchone()
+        return row is not None and row[0] == "done"
+
+    def known_sha1(self, path: Path, stat) -> str | None:
+        """SHA-1 ya calculado de `path` si el fichero no ha cambiado desde entonces."""
+        row = self.db.execute(
+            "SELECT sha1 FROM files WHERE path = ? AND size = ? AND mtime = ?", (str(path), stat.st_size, stat.st_mtime),
+        ).fetchone()
+        return row[0] if row else None
+
+    def store(self, item: dict, status: str, boxes=None, error=None):
+        with self.db:
+            self.db.execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (item["sha1"], str(item["image"]), str(item["metadata"]) if item["metadata"] else None,
+                 item["day"], status, item["attempts"], len(boxes) if boxes is not None else None,
+                 json.dumps(boxes) if boxes is not None else None, self.weights_path.name, error,
+                 datetime.now().isoformat(timespec="seconds")),
+            )
+
+    # --- Ingesta ---
+    def _ready_images(self):
+        now = time.monotonic()
+        listed = set()
+        for path in sorted(self.drop_dir.iterdir()):
+            if path.suffix.lower() not in IMAGE_EXTENSIONS or path in self.pending:
+                continue
+            try:
+                stat = path.stat()
+            except FileNotFoundError:  # Movido o borrado desde el listado
+                self.seen_sizes.pop(path, None)
+                continue
+            listed.add(path)
+            if self.failed.get(path) == (stat.st_size, stat.st_mtime):
+                continue  # Agotó sus reintentos y no ha cambiado
+            sha1 = self.known_sha1(path, stat)
+            if sha1 is not None and self.is_done(sha1):
+                continue
+            size = stat.st_size
+            previous = self.seen_sizes.get(path)
+            self.seen_sizes[path] = (size, previous[1] if previous else now)
+            if previous is None or previous[0] != size:
+                continue  # Todavía se está copiando (o recién visto)
+            metadata = self.metadata_dir / f"{path.stem}.json"
+            if not metadata.exists() and now - previous[1] < self.json_timeout:
+                continue  # Esperando a su JSON
+            yield path, metadata if metadata.exists() else None, sha1
+        # Ficheros que desaparecieron mientras se copiaban o esperaban a su JSON
+        for path in self.seen_sizes.keys() - listed:
+            del self.seen_sizes[path]
+
+    async def scan(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            for path, metadata, sha1 in list(self._ready_images()):
+                self.seen_sizes.pop(path, None)
+                try:
+                    stat = path.stat()
+                    if sha1 is None:
+                        sha1 = await loop.run_in_executor(None, file_hash, path)
+                        stat = path.stat()
+                        with self.db:
+                            self.db.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)", (str(path), stat.st_size, stat.st_mtime, sha1))
+                except FileNotFoundError:
+                    logger.warning(f"{path.name} desapareció antes de procesarla; se omite.")
+                    continue
+                if sha1 in self.pending_hashes or self.is_done(sha1):
+                    continue  # Copia de una imagen ya encolada o procesada
+                day = None
+                if metadata:
+                    try:
+                        day = calcular_dia_cultivo_desde_json(str(metadata))
+                    except Exception as e:  # noqa: BLE001 - un JSON mal formado no debe parar el demonio
+                        logger.warning(f"Error procesando {metadata.name}: {e}")
+                self.pending.add(path)
+                self.pending_hashes.add(sha1)
+                # Si la cola está llena, esperamos aquí: backpressure sobre el escáner
+                await self.queue.put({"image": path, "metadata": metadata, "sha1": sha1, "day": day, "attempts": 0,
+                                      "stat": (stat.st_size, stat.st_mtime)})
+            await asyncio.sleep(self.poll_interval)
+
+    # --- Inferencia ---
+    async def next_batch(self):
+        batch = [await self.queue.get()]
+        deadline = time.monotonic() + self.batch_wait
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def process(self, batch):
+        loop = asyncio.get_running_loop()
+        pool = self.pool
+        try:
+            outputs = await loop.run_in_executor(pool, _infer_batch, [str(i["image"]) for i in batch], self.conf)
+        except Exception as e:  # noqa: BLE001 - cualquier fallo del worker se reintenta
+            if isinstance(e, BrokenProcessPool) and self.pool is pool:
+                # Un worker murió (p. ej. sin memoria): el pool ya no sirve y hay que recrearlo.
+                # Sólo lo recrea el primer lote que lo detecta; los demás reintentan en el nuevo
+                logger.warning("El pool de inferencia se ha roto; se vuelve a crear.")
+                pool.shutdown(wait=False, cancel_futures=True)
+                self.pool = self.new_pool()
+            for item in batch:
+                item["attempts"] += 1
+                if item["attempts"] >= self.max_retries:
+                    logger.error(f"❌ {item['image'].name} descartada tras {item['attempts']} intentos: {e}")
+                    self.store(item, "failed", error=str(e))
+                    self.failed[item["image"]] = item["stat"]
+                    self.pending.discard(item["image"])
+                    self.pending_hashes.discard(item["sha1"])
+                else:
+                    delay = 2 ** item["attempts"]
+                    logger.warning(f"Reintentando {item['image'].name} en {delay}s ({e})")
+                    self.spawn(self.requeue(item, delay))
+            return
+        finally:
+            self.inflight.release()
+
+        for item, boxes in zip(batch, outputs):
+            item["attempts"] += 1
+            self.store(item, "done", boxes=boxes)
+            self.failed.pop(item["image"], None)
+            self.pending.discard(item["image"])
+            self.pending_hashes.discard(item["sha1"])
+        logger.info(f"Lote de {len(batch)} imágenes procesado ({self.queue.qsize()} en cola).")
+
+    async def requeue(self, item, delay):
+        await asyncio.sleep(delay)
+        # put() espera si la cola está llena en vez de perder la imagen
+        await self.queue.put(item)
+
+    def spawn(self, coro):
+        task = asyncio.create_task(coro)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def consume(self):
+        while True:
+            batch = await self.next_batch()
+            await self.inflight.acquire()  # Como mucho un lote por worker a la vez
+            self.spawn(self.process(batch))
+
+    async def run(self):
+        logger.info(f"👀 Vigilando {self.drop_dir} (modelo: {self.weights_path})")
+        try:
+            await asyncio.gather(self.scan(), self.consume())
+        finally:
+            self.pool.shutdown(cancel_futures=True)
+            self.db.close()
+
+
+@app.command()
+def main(
+    weights_path: Path = typer.Option(..., "--weights-path", help="Pesos del modelo (ej: models/experimento/weights/best.pt)."),
+    drop_dir: Path = typer.Option(..., "--drop-dir", help="Carpeta donde las cámaras dejan las imágenes."),
+    metadata_dir: Path = typer.Option(None, "--metadata-dir", help="Carpeta de los JSON de metadatos. Por defecto, la misma que --drop-dir."),
+    db_path: Path = typer.Option(Path("reports/predictions.sqlite"), "--db", help="Base de datos SQLite donde se añaden los resultados."),
+    workers: int = typer.Option(2, "--workers", help="Procesos de inferencia (cada uno carga su modelo)."),
+    batch_size: int = typer.Option(8, "--batch-size", help="Imágenes por lote de inferencia."),
+    batch_wait: float = typer.Option(1.0, "--batch-wait", help="Segundos máximos esperando a completar un lote."),
+    queue_size: int = typer.Option(256, "--queue-size", help="Tamaño máximo de la cola (backpressure)."),
+    poll_interval: float = typer.Option(2.0, "--poll-interval", help="Segundos entre sondeos de la carpeta."),
+    json_timeout: float = typer.Option(30.0, "--json-timeout", help="Segundos esperando al JSON antes de procesar la imagen sin día de cultivo."),
+    max_retries: int = typer.Option(3, "--max-retries", help="Intentos por imagen antes de marcarla como fallida."),
+    conf: float = typer.Option(0.25, "--conf", help="Confianza mínima de las detecciones."),
+):
+    """
+    Demonio que vigila una carpeta y procesa las imágenes nuevas a medida que llegan:
+    empareja cada imagen con su JSON, calcula el día de cultivo, infiere por lotes en un
+    pool de procesos y añade los resultados a una base de datos local.
+    """
+    if not weights_path.exists():
+        logger.error("El fichero de pesos especificado no existe.")
+        raise typer.Exit(code=1)
+    if not drop_dir.is_dir():
+        logger.error(f"La carpeta {drop_dir} no existe.")
+        raise typer.Exit(code=1)
+    db_path.parent.mkdir(parents=True, exist_ok=True)
+
+    pipeline = FolderPipeline(
+        drop_dir, metadata_dir or drop_dir, db_path, weights_path, workers, batch_size, batch_wait,
+        queue_size, poll_interval, json_timeout, max_retries, conf,
+    )
+    try:
+        asyncio.run(pipeline.run())
+    except KeyboardInterrupt:
+        logger.info("🛑 Demonio detenido.")
+
+
+if __name__ == "__main__":
+    app()
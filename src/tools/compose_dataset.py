@@ -0,0 +1,407 @@
+"""
+Composición del dataset final a partir de N fuentes descritas en un YAML.
+
+Cada fuente indica:
+  - layout: cómo están organizados sus ficheros (ver LAYOUTS; se añaden nuevos con @layout).
+  - split:  'predefined' (respeta los splits de la fuente) o una SplitStrategy
+            (random, day, group, stratified) con sus ratios.
+  - weight: factor de muestreo de train (2 = cada imagen aparece dos veces, 0.5 = la mitad).
+  - classes: remapeo id de clase de la fuente -> nombre de clase de salida (null la descarta).
+
+Las muestras se generan fuente a fuente y se copian con un pool de hilos con un número
+acotado de tareas pendientes, sin construir listas intermedias de todo el dataset. La
+composición es incremental: sólo se copian los ficheros nuevos o modificados y se borran
+los que ya no corresponden. El manifiesto del dataset de salida guarda el split de cada
+muestra, su grupo (fecha o campo de `group_key`) y la firma de la política de split de su
+fuente (política, group_key, ratios y semilla): mientras la firma no cambie, las muestras
+existentes conservan su split y las nuevas de un grupo ya presente van al split de ese
+grupo; si cambia, se recalcula la fuente entera.
+"""
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import csv
+import hashlib
+import json
+import math
+import os
+from pathlib import Path
+import shutil
+from typing import NamedTuple
+
+from loguru import logger
+import pandas as pd
+import yaml
+
+from config import IMAGE_EXTENSIONS
+from tools.dedup import deduplicate, write_report
+from tools.split_strategies import SplitStrategy, assign_splits, build_index
+
+PROJ_ROOT = Path(__file__).resolve().parents[2]
+SPLITS = ("train", "val", "test")
+MANIFEST_FILENAME = ".compose_manifest.csv"
+PREDEFINED = "predefined"
+
+DEFAULT_SPEC = {
+    "seed": 42,
+    "ratios": {"train": 0.8, "val": 0.1, "test": 0.1},
+    "dedup": {"enabled": True, "drop": False, "threshold": 4},
+}
+
+
+class Part(NamedTuple):
+    """Una carpeta de imágenes con su carpeta de etiquetas y, si lo trae, su split."""
+    images_dir: Path
+    labels_dir: Path
+    split: str | None
+
+
+class Item(NamedTuple):
+    source: str
+    key: str
+    image: Path
+    label: Path
+    split: str
+    group: str
+    dst_stem: str
+    remap: dict | None
+    min_boxes: int
+
+
+# --- Adaptadores de layout ---
+LAYOUTS = {}
+
+
+def layout(name):
+    def register(fn):
+        LAYOUTS[name] = fn
+        return fn
+    return register
+
+
+@layout("flat")
+def flat_layout(root: Path, source: dict) -> list[Part]:
+    """<root>/images y <root>/labels sin dividir (ej. interim/primordia_date_split)."""
+    return [Part(root / source.get("images", "images"), root / source.get("labels", "labels"), None)]
+
+
+@layout("yolo_splits")
+def yolo_splits_layout(root: Path, source: dict) -> list[Part]:
+    """<root>/images/<split> y <root>/labels/<split> (ej. external/m18ka)."""
+    return [
+        Part(root / "images" / split, root / "labels" / split, split)
+        for split in SPLITS if (root / "labels" / split).exists()
+    ]
+
+
+@layout("data_yaml")
+def data_yaml_layout(root: Path, source: dict) -> list[Part]:
+    """Dataset exportado con su data.yaml de Ultralytics (rutas train/val/test de imágenes)."""
+    with open(root / source.get("data_yaml", "data.yaml"), "r", encoding="utf-8") as f:
+        data_cfg = yaml.safe_load(f)
+    base = root / data_cfg.get("path", ".")
+    parts = []
+    for split in SPLITS:
+        if isinstance(data_cfg.get(split), str):
+            images_dir = base / data_cfg[split]
+            labels_dir = Path(*("labels" if p == "images" else p for p in images_dir.parts))
+            parts.append(Part(images_dir, labels_dir, split))
+    return parts
+
+
+# --- Especificación ---
+def load_spec(spec_path: Path) -> dict:
+    with open(spec_path, "r", encoding="utf-8") as f:
+        spec = yaml.safe_load(f)
+    spec = {**DEFAULT_SPEC, **spec, "dedup": {**DEFAULT_SPEC["dedup"], **spec.get("dedup", {})}}
+    if not spec.get("sources"):
+        raise ValueError(f"'{spec_path}' no define ninguna fuente en 'sources'.")
+    if not spec.get("names"):
+        raise ValueError(f"'{spec_path}' no define las clases de salida en 'names'.")
+    for source in spec["sources"]:
+        if source.get("layout") not in LAYOUTS:
+            raise ValueError(f"Fuente '{source.get('name')}': layout '{source.get('layout')}' desconocido. Disponibles: {sorted(LAYOUTS)}.")
+        policy = source.setdefault("split", {}).setdefault("policy", PREDEFINED)
+        if policy != PREDEFINED and policy not in SplitStrategy.__members__:
+            raise ValueError(f"Fuente '{source['name']}': política de split '{policy}' desconocida.")
+        if policy == SplitStrategy.group.value and not source["split"].get("group_key"):
+            raise ValueError(f"Fuente '{source['name']}': la política 'group' necesita 'group_key'.")
+    return spec
+
+
+def resolve_path(path) -> Path:
+    path = Path(path)
+    return path if path.is_absolute() else PROJ_ROOT / path
+
+
+def class_remap(source: dict, names: list[str]) -> dict | None:
+    """{id origen: id salida o None}; None si la fuente usa las mismas clases."""
+    if "classes" not in source:
+        return None
+    remap = {}
+    for src_id, target in source["classes"].items():
+        if target is None:
+            remap[int(src_id)] = None
+        elif isinstance(target, int):
+            remap[int(src_id)] = target
+        elif target in names:
+            remap[int(src_id)] = names.index(target)
+        else:
+            raise ValueError(f"Fuente '{source['name']}': la clase '{target}' no está en 'names'.")
+    return remap
+
+
+def source_metadata_dir(source: dict) -> Path:
+    """Carpeta con los JSON de metadatos de una fuente (<clave>.json)."""
+    return resolve_path(source["root"]) / source.get("metadata", "data")
+
+
+def stable_fraction(*parts) -> float:
+    """Número en [0, 1) reproducible a partir de `parts` (no depende del orden de lectura)."""
+    digest = hashlib.sha1(":".join(map(str, parts)).encode("utf-8")).hexdigest()
+    return int(digest[:8], 16) / 2**32
+
+
+# --- Muestras ---
+def iter_part(part: Part):
+    """(clave, imagen, etiqueta) de una carpeta, sin glob por etiqueta."""
+    images = {}
+    with os.scandir(part.images_dir) as entries:
+        for entry in entries:
+            stem, suffix = os.path.splitext(entry.name)
+            if suffix.lower() in IMAGE_EXTENSIONS:
+                images.setdefault(stem, Path(entry.path))
+    with os.scandir(part.labels_dir) as entries:
+        for entry in entries:
+            stem, suffix = os.path.splitext(entry.name)
+            if suffix != ".txt":
+                continue
+            image = images.get(stem)
+            if image is None:
+                logger.warning(f"No se encontró imagen para la etiqueta {entry.path}, se omitirá.")
+                continue
+            yield stem, image, Path(entry.path)
+
+
+def split_signature(source: dict, spec: dict) -> str:
+    """Resumen de todo lo que determina el split de una fuente."""
+    split_cfg = source["split"]
+    return json.dumps({
+        "policy": split_cfg["policy"],
+        "group_key": split_cfg.get("group_key") if split_cfg["policy"] == SplitStrategy.group.value else None,
+        "ratios": split_cfg.get("ratios", spec["ratios"]),
+        "seed": spec["seed"],
+    }, sort_keys=True)
+
+
+def source_samples(source: dict, spec: dict, previous: dict):
+    """(clave, imagen, etiqueta, split, grupo) de una fuente según su política de split."""
+    root = resolve_path(source["root"])
+    parts = LAYOUTS[source["layout"]](root, source)
+    policy = source["split"]["policy"]
+
+    if policy == PREDEFINED:
+        for part in parts:
+            if part.split is None:
+                raise ValueError(f"Fuente '{source['name']}': el layout '{source['layout']}' no trae splits; indica una política.")
+            for key, image, label in iter_part(part):
+                yield key, image, label, part.split, ""
+        return
+
+    # El resto de políticas necesitan ver la fuente completa: se usa el índice cacheado
+    metadata_dir = source_metadata_dir(source)
+    frames = []
+    for part in parts:
+        cache_path = part.labels_dir.parent / (f".index_{part.split}.csv" if part.split else ".index.csv")
+        frames.append(build_index(part.labels_dir, part.images_dir, metadata_dir, cache_path))
+    index = pd.concat([f for f in frames if not f.empty], ignore_index=True) if any(not f.empty for f in frames) else pd.DataFrame()
+    if index.empty:
+        return
+    ratios = source["split"].get("ratios", spec["ratios"])
+    index["split"] = assign_splits(
+        index, ratios, SplitStrategy(policy), group_key=source["split"].get("group_key"), seed=spec["seed"],
+    )
+
+    # Grupo de cada muestra: la fecha o el campo de agrupación (como en assign_splits); en
+    # random y stratified cada imagen es su propio grupo
+    group_col = {SplitStrategy.day.value: "meta_fecha", SplitStrategy.group.value: f"meta_{source['split'].get('group_key')}"}.get(policy)
+    if group_col in index.columns:
+        groups = index[group_col].astype(str).where(index[group_col].notna(), "__" + index["stem"])
+    else:
+        groups = index["stem"]
+
+    # Fusión incremental con la misma política: los grupos ya presentes mantienen su split
+    known = previous.get(source["name"])
+    pinned = known["groups"] if known and known["signature"] == split_signature(source, spec) else {}
+    if known and not pinned:
+        logger.info(f"La política de split de '{source['name']}' ha cambiado: se recalculan todos sus splits.")
+    for key, image, label, split, group in zip(index["stem"], index["image_path"], index["label_path"], index["split"], groups):
+        yield key, Path(image), Path(label), pinned.get(group, split), group
+
+
+def plan_items(sources: list[dict], spec: dict, previous: dict, to_drop: set):
+    """Genera las copias a realizar, aplicando el peso de muestreo a train."""
+    for source in sources:
+        prefix = source.get("prefix", source["name"])
+        weight = float(source.get("weight", 1.0))
+        remap = class_remap(source, spec["names"])
+        min_boxes = int(source.get("min_boxes", 0))
+        for key, image, label, split, group in source_samples(source, spec, previous):
+            if image in to_drop:
+                continue
+            copies = 1
+            if split == "train":
+                frac = stable_fraction(spec["seed"], source["name"], key)
+                copies = math.floor(weight) + (frac < weight - math.floor(weight))
+            for i in range(copies):
+                dst_stem = f"{prefix}_{key}" if i == 0 else f"{prefix}_{key}_r{i}"
+                yield Item(source["name"], key, image, label, split, group, dst_stem, remap, min_boxes)
+
+
+# --- Escritura ---
+def is_up_to_date(src: Path, dst: Path) -> bool:
+    return dst.exists() and dst.stat().st_size == src.stat().st_size and dst.stat().st_mtime >= src.stat().st_mtime
+
+
+def link_or_copy(src: Path, dst: Path):
+    """Enlace duro si el sistema de ficheros lo permite (evita duplicar imágenes); si no, copia."""
+    if dst.exists():
+        dst.unlink()
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+def materialize(item: Item, output_dir: Path):
+    """Copia la imagen y la etiqueta (remapeada) de una muestra. Devuelve (item, estado, rutas)."""
+    dst_image = output_dir / "images" / item.split / f"{item.dst_stem}{item.image.suffix}"
+    dst_label = output_dir / "labels" / item.split / f"{item.dst_stem}.txt"
+
+    with open(item.label, "r", encoding="utf-8") as f:
+        lines = [line.split() for line in f if line.strip()]
+    if item.remap is not None:
+        lines = [
+            [str(item.remap[int(float(cls))]), *coords]
+            for cls, *coords in lines if item.remap.get(int(float(cls))) is not None
+        ]
+    if len(lines) < item.min_boxes:
+        return item, "skipped", ()
+
+    status = "unchanged"
+    if item.remap is None:
+        if not is_up_to_date(item.label, dst_label):
+            link_or_copy(item.label, dst_label)
+            status = "copied"
+    else:
+        content = "".join(" ".join(line) + "\n" for line in lines)
+        if not dst_label.exists() or dst_label.read_text(encoding="utf-8") != content:
+            dst_label.write_text(content, encoding="utf-8")
+            status = "copied"
+    if not is_up_to_date(item.image, dst_image):
+        link_or_copy(item.image, dst_image)
+        status = "copied"
+    return item, status, (dst_image, dst_label)
+
+
+def bounded_map(fn, items, workers: int, max_pending: int):
+    """Como pool.map pero sin consumir de golpe el generador de entrada."""
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = set()
+        for item in items:
+            pending.add(pool.submit(fn, item))
+            if len(pending) >= max_pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                yield from (future.result() for future in done)
+        for future in pending:
+            yield future.result()
+
+
+def read_manifest(output_dir: Path) -> dict:
+    """{fuente: {'signature': firma del split, 'groups': {grupo: split}}} de la última composición."""
+    path = output_dir / MANIFEST_FILENAME
+    if not path.exists():
+        return {}
+    previous = {}
+    with open(path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            known = previous.setdefault(row["source"], {"signature": row["signature"], "groups": {}})
+            known["groups"].setdefault(row["group"] or row["key"], row["split"])
+    return previous
+
+
+def compose(spec: dict, workers: int = 8, rebuild: bool = False, reports_dir: Path | None = None, cache_dir: Path | None = None):
+    """Genera o actualiza el dataset de salida descrito por `spec`."""
+    output_dir = resolve_path(spec["output"])
+    if rebuild and output_dir.exists():
+        shutil.rmtree(output_dir)
+    for kind in ("images", "labels"):
+        for split in SPLITS:
+            (output_dir / kind / split).mkdir(parents=True, exist_ok=True)
+    sources = spec["sources"]
+    previous = read_manifest(output_dir)
+
+    # --- Deduplicación (necesita ver todas las imágenes, pero sólo sus rutas) ---
+    to_drop = set()
+    if spec["dedup"]["enabled"]:
+        logger.info("Buscando imágenes casi duplicadas entre todas las fuentes...")
+        by_split = {split: [] for split in SPLITS}
+        for source in sources:
+            for _, image, _, split, _ in source_samples(source, spec, previous):
+                by_split[split].append(image)
+        # Primero train: los duplicados que cruzan splits se eliminan de val/test
+        ordered = [image for split in SPLITS for image in by_split[split]]
+        duplicates, clusters = deduplicate(ordered, (cache_dir or output_dir.parent) / "dhash_cache.csv", spec["dedup"]["threshold"])
+        report_path = (reports_dir or output_dir) / "duplicates.csv"
+        write_report(report_path, clusters)
+        logger.info(f"Informe de duplicados guardado en '{report_path}'.")
+        if spec["dedup"]["drop"]:
+            to_drop = duplicates
+
+    # --- Copia en streaming ---
+    stats = Counter()
+    written = set()
+    signatures = {source["name"]: split_signature(source, spec) for source in sources}
+    manifest_tmp = output_dir / f"{MANIFEST_FILENAME}.tmp"
+    with open(manifest_tmp, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["source", "key", "split", "group", "signature", "image", "label"])
+        items = plan_items(sources, spec, previous, to_drop)
+        for item, status, paths in bounded_map(lambda i: materialize(i, output_dir), items, workers, workers * 4):
+            stats[(item.source, item.split, status)] += 1
+            if status == "skipped":
+                continue
+            written.update(paths)
+            writer.writerow([
+                item.source, item.key, item.split, item.group, signatures[item.source],
+                *(p.relative_to(output_dir) for p in paths),
+            ])
+    os.replace(manifest_tmp, output_dir / MANIFEST_FILENAME)
+
+    # --- Limpieza de lo que ya no forma parte del dataset ---
+    removed = 0
+    for kind in ("images", "labels"):
+        for split in SPLITS:
+            for path in (output_dir / kind / split).iterdir():
+                if path not in written:
+                    path.unlink()
+                    removed += 1
+
+    for source in sources:
+        counts = {
+            split: sum(n for (s, sp, st), n in stats.items() if s == source["name"] and sp == split and st != "skipped")
+            for split in SPLITS
+        }
+        copied = sum(n for (s, _, st), n in stats.items() if s == source["name"] and st == "copied")
+        logger.info(f"'{source['name']}': {counts['train']} train, {counts['val']} val, {counts['test']} test ({copied} copiadas o actualizadas).")
+    if removed:
+        logger.info(f"Eliminados {removed} ficheros que ya no forman parte del dataset.")
+
+    names = spec["names"]
+    yaml_content = {
+        'path': str(output_dir.resolve()), 'train': 'images/train', 'val': 'images/val', 'test': 'images/test',
+        'nc': len(names), 'names': names
+    }
+    with open(output_dir / "data.yaml", 'w') as f:
+        yaml.dump(yaml_content, f, sort_keys=False, indent=2)
+    return output_dir
@@ -0,0 +1,221 @@
+"""
+Detección de imágenes casi duplicadas mediante hashes perceptuales.
+
+Se calcula un dHash de 64 bits por imagen (en paralelo), se indexan en un BK-tree
+para buscar vecinos por distancia de Hamming sin comparar todos contra todos, y se
+agrupan en clusters alrededor de un representante (sin encadenar vecinos de vecinos).
+Los hashes se cachean por el hash del fichero, así que las imágenes que no cambian no
+se vuelven a decodificar.
+"""
+from concurrent.futures import ProcessPoolExecutor
+import csv
+import hashlib
+from pathlib import Path
+import sys
+
+from loguru import logger
+from PIL import Image
+from tqdm import tqdm
+import typer
+
+# Permite importar los módulos de src/ al ejecutar como script (python src/tools/...)
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from config import IMAGE_EXTENSIONS  # noqa: E402
+
+
+app = typer.Typer()
+
+
+def file_hash(path: Path) -> str:
+    """SHA-1 del contenido del fichero (clave de la caché)."""
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def dhash(path: Path, hash_size: int = 8) -> int:
+    """Difference hash: compara píxeles vecinos de una miniatura en escala de grises."""
+    with Image.open(path) as img:
+        img.draft("L", (hash_size * 4, hash_size * 4))  # Decodificación reducida en JPEG
+        small = img.convert("L").resize((hash_size + 1, hash_size), Image.Resampling.LANCZOS)
+    pixels = list(small.getdata())
+    value = 0
+    for row in range(hash_size):
+        for col in range(hash_size):
+            left = pixels[row * (hash_size + 1) + col]
+            right = pixels[row * (hash_size + 1) + col + 1]
+            value = (value << 1) | (left > right)
+    return value
+
+
+def _hash_worker(path: str) -> int:
+    return dhash(Path(path))
+
+
+def compute_hashes(image_paths: list[Path], cache_path: Path, workers: int | None = None) -> dict[Path, int]:
+    """
+    Devuelve {ruta: dhash}. Los dHash se cachean en un CSV indexado por el SHA-1 del
+    fichero; sólo se decodifican las imágenes cuyo contenido no está en la caché.
+    """
+    cache = {}
+    if cache_path.exists():
+        with open(cache_path, newline="", encoding="utf-8") as f:
+            cache = {row["sha1"]: int(row["dhash"], 16) for row in csv.DictReader(f)}
+
+    hashes, pending = {}, []
+    # El SHA-1 es barato comparado con decodificar la imagen
+    for path in tqdm(image_paths, desc="Comprobando caché de hashes", leave=False):
+        sha1 = file_hash(path)
+        if sha1 in cache:
+            hashes[path] = cache[sha1]
+        else:
+            pending.append((path, sha1))
+
+    if pending:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = pool.map(_hash_worker, [str(p) for p, _ in pending], chunksize=32)
+            for (path, sha1), value in tqdm(zip(pending, results), total=len(pending), desc="Calculando hashes perceptuales", colour="green"):
+                hashes[path] = value
+                cache[sha1] = value
+
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(cache_path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(["sha1", "dhash"])
+            writer.writerows((sha1, f"{value:016x}") for sha1, value in cache.items())
+
+    logger.info(f"Hashes: {len(image_paths) - len(pending)} desde caché, {len(pending)} calculados.")
+    return hashes
+
+
+class BKTree:
+    """BK-tree sobre distancia de Hamming para búsquedas por radio sub-cuadráticas."""
+
+    def __init__(self):
+        self.root = None  # (valor, [ids], {distancia: nodo})
+
+    @staticmethod
+    def distance(a: int, b: int) -> int:
+        return (a ^ b).bit_count()
+
+    def add(self, value: int, item_id: int):
+        if self.root is None:
+            self.root = (value, [item_id], {})
+            return
+        node = self.root
+        while True:
+            d = self.distance(value, node[0])
+            if d == 0:
+                node[1].append(item_id)
+                return
+            child = node[2].get(d)
+            if child is None:
+                node[2][d] = (value, [item_id], {})
+                return
+            node = child
+
+    def query(self, value: int, radius: int) -> list[int]:
+        """Ids de todos los elementos a distancia <= radius."""
+        found, stack = [], [self.root] if self.root else []
+        while stack:
+            node = stack.pop()
+            d = self.distance(value, node[0])
+            if d <= radius:
+                found.extend(node[1])
+            for child_d, child in node[2].items():
+                if d - radius <= child_d <= d + radius:
+                    stack.append(child)
+        return found
+
+
+def find_clusters(hashes: list[int], threshold: int) -> list[list[int]]:
+    """
+    Agrupa los índices alrededor de representantes: cada hash se une al representante más
+    cercano a distancia <= threshold o, si no hay ninguno, pasa a ser representante. No hay
+    encadenamiento (A~B y B~C no une A con C), así que en una secuencia time-lapse lenta sólo
+    se agrupan los fotogramas realmente parecidos al que se conserva. El primer índice de
+    cada cluster es su representante.
+    """
+    tree = BKTree()  # Sólo contiene representantes
+    clusters = {}
+    for i, value in enumerate(hashes):
+        matches = tree.query(value, threshold)
+        if matches:
+            leader = min(matches, key=lambda j: (BKTree.distance(value, hashes[j]), j))
+            clusters[leader].append(i)
+        else:
+            tree.add(value, i)
+            clusters[i] = [i]
+    return [members for members in clusters.values() if len(members) > 1]
+
+
+def write_report(report_path: Path, clusters: list[list[Path]]):
+    report_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(report_path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["cluster", "image_path", "kept"])
+        for cluster_id, members in enumerate(clusters):
+            for position, path in enumerate(members):
+                writer.writerow([cluster_id, str(path), position == 0])
+
+
+def deduplicate(
+    image_paths: list[Path],
+    cache_path: Path,
+    threshold: int = 4,
+    workers: int | None = None,
+) -> tuple[set[Path], list[list[Path]]]:
+    """
+    Busca clusters de casi duplicados. Devuelve (rutas a descartar, clusters).
+
+    En cada cluster se conserva la primera imagen según el orden de `image_paths`, por
+    lo que el llamador decide la prioridad (ej. primero el split de train), y sólo se
+    descartan las imágenes a distancia <= threshold de ella.
+    """
+    hashes = compute_hashes(image_paths, cache_path, workers)
+    ordered = [p for p in image_paths if p in hashes]
+    clusters = [[ordered[i] for i in sorted(c)] for c in find_clusters([hashes[p] for p in ordered], threshold)]
+    to_drop = {p for members in clusters for p in members[1:]}
+    logger.info(f"Encontrados {len(clusters)} clusters de casi duplicados ({len(to_drop)} imágenes redundantes).")
+    return to_drop, clusters
+
+
+@app.command()
+def main(
+    input_dir: Path = typer.Option(..., "--input-dir", help="Directorio con imágenes (se busca recursivamente)."),
+    threshold: int = typer.Option(4, "--threshold", help="Distancia de Hamming máxima (de 64 bits) para considerar dos imágenes casi duplicadas."),
+    report_path: Path = typer.Option(Path("reports/duplicates.csv"), "--report", help="CSV con los clusters encontrados."),
+    drop: bool = typer.Option(False, "--drop/--report-only", help="Eliminar las imágenes redundantes (y sus etiquetas) o sólo informar."),
+    workers: int = typer.Option(None, "--workers", help="Procesos para calcular los hashes. Por defecto, todos los núcleos."),
+):
+    """
+    Detecta imágenes casi duplicadas en un directorio y genera un informe de clusters.
+    """
+    image_paths = sorted(p for p in input_dir.rglob("*.*") if p.suffix.lower() in IMAGE_EXTENSIONS)
+    if not image_paths:
+        logger.error(f"No se encontraron imágenes en {input_dir}")
+        raise typer.Exit()
+
+    to_drop, clusters = deduplicate(image_paths, input_dir / ".dhash_cache.csv", threshold, workers)
+    write_report(report_path, clusters)
+    logger.info(f"Informe guardado en {report_path}")
+
+    if drop:
+        for image_path in to_drop:
+            image_path.unlink()
+            # Estructura YOLO: .../images/<split>/x.jpg -> .../labels/<split>/x.txt
+            parts = list(image_path.parts)
+            if "images" not in parts:
+                continue
+            pos = len(parts) - 1 - parts[::-1].index("images")
+            parts[pos] = "labels"
+            label_path = Path(*parts).with_suffix(".txt")
+            if label_path.exists():
+                label_path.unlink()
+        logger.success(f"✅ Eliminadas {len(to_drop)} imágenes redundantes.")
+
+
+if __name__ == "__main__":
+    app()
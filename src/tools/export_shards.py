@@ -0,0 +1,162 @@
+import typer
+from pathlib import Path
+import io
+import json
+import random
+import sys
+import tarfile
+import pandas as pd
+from loguru import logger
+from tqdm import tqdm
+
+# Permite importar los módulos de src/ al ejecutar como script (python src/tools/...)
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from config import IMAGE_EXTENSIONS  # noqa: E402
+from tools.compose_dataset import MANIFEST_FILENAME, PROJ_ROOT, load_spec, source_metadata_dir  # noqa: E402
+
+app = typer.Typer()
+
+
+class ShardWriter:
+    """Escribe muestras (imagen + etiqueta + metadatos) en ficheros .tar de tamaño acotado."""
+
+    def __init__(self, output_dir: Path, split: str, max_bytes: int):
+        self.output_dir, self.split, self.max_bytes = output_dir, split, max_bytes
+        self.shards, self.tar, self.size, self.count = [], None, 0, 0
+
+    def _open_next(self):
+        self.close()
+        name = f"{self.split}-{len(self.shards):06d}.tar"
+        self.tar = tarfile.open(self.output_dir / name, "w")
+        self.shards.append({"file": name, "samples": 0})
+        self.size = 0
+
+    def _add(self, name: str, data: bytes):
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        self.tar.addfile(info, io.BytesIO(data))
+        self.size += len(data) + 512  # Cabecera tar
+
+    def write(self, key: str, image_path: Path, label_path: Path, metadata: dict):
+        if self.tar is None or self.size >= self.max_bytes:
+            self._open_next()
+        # Los ficheros de una misma muestra van seguidos para leerlos en una sola pasada
+        self._add(f"{key}{image_path.suffix.lower()}", image_path.read_bytes())
+        self._add(f"{key}.txt", label_path.read_bytes() if label_path.exists() else b"")
+        self._add(f"{key}.json", json.dumps(metadata, ensure_ascii=False).encode("utf-8"))
+        self.shards[-1]["samples"] += 1
+        self.count += 1
+
+    def close(self):
+        if self.tar is not None:
+            self.tar.close()
+            self.tar = None
+
+
+def read_metadata(metadata_path):
+    if metadata_path is None or not Path(metadata_path).exists():
+        return {}
+    with open(metadata_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def composed_metadata_paths(input_dir: Path, spec_path: Path, metadata_dir: Path | None) -> dict:
+    """
+    {imagen: JSON de metadatos} de un dataset generado por compose_dataset.py. Los nombres
+    de salida llevan el prefijo de la fuente (y _r<i> en las réplicas de train), así que la
+    muestra original se busca en su manifiesto: fuente y clave de cada copia. El JSON está
+    en `metadata_dir` si se indica o, si no, en la carpeta de metadatos de la fuente.
+    """
+    manifest_path = input_dir / MANIFEST_FILENAME
+    if not manifest_path.exists():
+        return {}
+    metadata_dirs = {}
+    if metadata_dir is None and spec_path.exists():
+        metadata_dirs = {source["name"]: source_metadata_dir(source) for source in load_spec(spec_path)["sources"]}
+    paths, unknown = {}, set()
+    for row in pd.read_csv(manifest_path, dtype=str).to_dict("records"):
+        source_dir = metadata_dir or metadata_dirs.get(row["source"])
+        if source_dir is None:
+            unknown.add(row["source"])
+            continue
+        paths[input_dir / row["image"]] = source_dir / f"{row['key']}.json"
+    if unknown:
+        logger.warning(f"Fuentes del manifiesto que no están en {spec_path}: {sorted(unknown)}. Sus muestras irán sin metadatos.")
+    return paths
+
+
+def samples_from_yolo_dir(input_dir: Path, split: str, metadata_paths: dict, metadata_dir: Path | None):
+    """(clave, imagen, etiqueta, json) para un split de un dataset con layout images/<split>, labels/<split>."""
+    for image_path in sorted((input_dir / "images" / split).glob("*.*")):
+        if image_path.suffix.lower() not in IMAGE_EXTENSIONS:
+            continue
+        label_path = input_dir / "labels" / split / f"{image_path.stem}.txt"
+        metadata_path = metadata_paths.get(image_path)
+        if metadata_path is None and metadata_dir and not metadata_paths:
+            metadata_path = metadata_dir / f"{image_path.stem}.json"  # Dataset sin manifiesto
+        yield image_path.stem, image_path, label_path, metadata_path
+
+
+def samples_from_csv(csv_path: Path, root_dir: Path):
+    """(clave, imagen, etiqueta, json) a partir de un manifiesto de dataset_csv.py."""
+    for row in pd.read_csv(csv_path).to_dict("records"):
+        image_path = root_dir / row["image_path"]
+        metadata_path = root_dir / row["metadata_path"] if isinstance(row.get("metadata_path"), str) else None
+        yield image_path.stem, image_path, root_dir / row["label_path"], metadata_path
+
+
+@app.command()
+def main(
+    input_dir: Path = typer.Option(Path("data/processed/final_dataset"), "--input-dir", help="Dataset con estructura images/<split> y labels/<split>."),
+    csv_dir: Path = typer.Option(None, "--csv-dir", help="Alternativa: carpeta con los manifiestos <split>.csv de dataset_csv.py."),
+    csv_root: Path = typer.Option(Path("data"), "--csv-root", help="Carpeta respecto a la que son relativas las rutas de los CSV."),
+    metadata_dir: Path = typer.Option(None, "--metadata-dir", help="Carpeta con los JSON de metadatos (layout YOLO). Por defecto, la de cada fuente según --spec."),
+    spec_path: Path = typer.Option(PROJ_ROOT / "configs" / "final_dataset.yaml", "--spec", help="YAML de fuentes con el que se compuso el dataset (layout YOLO)."),
+    output_dir: Path = typer.Option(Path("data/processed/shards"), "--output-dir", help="Carpeta de salida de los shards."),
+    shard_size_mb: int = typer.Option(256, "--shard-size-mb", help="Tamaño aproximado de cada shard en MB."),
+    seed: int = typer.Option(42, "--seed", help="Semilla para mezclar las muestras antes de escribirlas."),
+):
+    """
+    Empaqueta el dataset en shards .tar grandes (imagen, etiqueta YOLO y metadatos JSON
+    juntos) para leerlo secuencialmente desde almacenamiento en red.
+    """
+    output_dir.mkdir(parents=True, exist_ok=True)
+    splits = ["train", "val", "test"]
+    rng = random.Random(seed)
+    metadata_paths = {} if csv_dir else composed_metadata_paths(input_dir, spec_path, metadata_dir)
+
+    for split in splits:
+        if csv_dir:
+            csv_path = csv_dir / f"{split}.csv"
+            if not csv_path.exists():
+                continue
+            samples = list(samples_from_csv(csv_path, csv_root))
+        else:
+            if not (input_dir / "images" / split).exists():
+                continue
+            samples = list(samples_from_yolo_dir(input_dir, split, metadata_paths, metadata_dir))
+        if not samples:
+            logger.warning(f"No hay muestras para el split '{split}'. Omitiendo.")
+            continue
+
+        # Los ficheros suelen estar ordenados por día/cama; se mezclan al escribir para que
+        # el buffer de mezcla del lector parta de un orden ya aleatorio
+        rng.shuffle(samples)
+        writer = ShardWriter(output_dir, split, shard_size_mb * 1024 * 1024)
+        for key, image_path, label_path, metadata_path in tqdm(samples, desc=f"Empaquetando {split}", colour="green"):
+            if not image_path.exists():
+                logger.warning(f"No se encontró la imagen {image_path}, se omitirá.")
+                continue
+            writer.write(key, image_path, label_path, read_metadata(metadata_path))
+        writer.close()
+
+        index = {"split": split, "samples": writer.count, "shards": writer.shards}
+        with open(output_dir / f"{split}.json", "w", encoding="utf-8") as f:
+            json.dump(index, f, indent=2)
+        logger.info(f"'{split}': {writer.count} muestras en {len(writer.shards)} shards.")
+
+    logger.success(f"✅ Shards guardados en '{output_dir}'")
+
+
+if __name__ == "__main__":
+    app()
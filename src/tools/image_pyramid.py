@@ -0,0 +1,194 @@
+"""
+Versiones reducidas (pirámide) de un dataset YOLO, una por imgsz.
+
+Cada nivel es un dataset completo <dataset>_pyramid/<imgsz>/ con su data.yaml, en el que el
+lado largo de cada imagen mide `imgsz` (nunca se amplía). Como se conserva la relación de
+aspecto, las etiquetas YOLO (normalizadas a 0-1) son las mismas y se enlazan sin cambios.
+Ultralytics redimensiona igualmente a imgsz al cargar, así que entrenar sobre un nivel da
+el mismo resultado que sobre los originales sin decodificar imágenes de resolución completa.
+
+pyramid.json guarda una firma del dataset original (rutas, tamaños y mtimes de imágenes y
+etiquetas). Si el original cambia después (otro split, duplicados eliminados...), la
+pirámide deja de usarse hasta que se vuelva a generar.
+"""
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
+import json
+import os
+from pathlib import Path
+import sys
+
+from loguru import logger
+from PIL import Image, ImageOps
+from tqdm import tqdm
+import typer
+import yaml
+
+# Permite importar los módulos de src/ al ejecutar como script (python src/tools/...)
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from config import IMAGE_EXTENSIONS  # noqa: E402
+from tools.compose_dataset import is_up_to_date, link_or_copy  # noqa: E402
+SPLIT_KEYS = ("train", "val", "test")
+MANIFEST = "pyramid.json"
+
+app = typer.Typer()
+
+
+def pyramid_dir(data_yaml_path: Path) -> Path:
+    """Carpeta hermana del dataset donde viven sus niveles: <dataset>_pyramid/."""
+    root = dataset_root(data_yaml_path)
+    return root.parent / f"{root.name}_pyramid"
+
+
+def dataset_root(data_yaml_path: Path) -> Path:
+    with open(data_yaml_path, "r", encoding="utf-8") as f:
+        data_cfg = yaml.safe_load(f)
+    root = Path(data_cfg.get("path") or data_yaml_path.parent)
+    return root if root.is_absolute() else (data_yaml_path.parent / root).resolve()
+
+
+def source_files(data_yaml_path: Path) -> tuple[list[Path], list[Path]]:
+    """Imágenes de los splits del data.yaml y las etiquetas que existen para ellas."""
+    with open(data_yaml_path, "r", encoding="utf-8") as f:
+        data_cfg = yaml.safe_load(f)
+    root = dataset_root(data_yaml_path)
+    images, labels = [], []
+    for key in SPLIT_KEYS:
+        if not isinstance(data_cfg.get(key), str):
+            continue
+        split_dir = root / data_cfg[key]
+        images += [p for p in sorted(split_dir.rglob("*")) if p.suffix.lower() in IMAGE_EXTENSIONS]
+    for image in images:
+        rel = image.relative_to(root)
+        label = root / Path(*("labels" if part == "images" else part for part in rel.parts)).with_suffix(".txt")
+        if label.exists():
+            labels.append(label)
+    return images, labels
+
+
+def source_signature(data_yaml_path: Path) -> str:
+    """Hash de las rutas relativas, tamaños y mtimes de todas las imágenes y etiquetas."""
+    root = dataset_root(data_yaml_path)
+    images, labels = source_files(data_yaml_path)
+    h = hashlib.sha1()
+    for path in images + labels:
+        stat = path.stat()
+        h.update(f"{path.relative_to(root)}|{stat.st_size}|{stat.st_mtime_ns}\n".encode("utf-8"))
+    return h.hexdigest()
+
+
+def resolve_data_yaml(data_yaml_path, imgsz: int) -> str:
+    """
+    data.yaml del nivel más pequeño de la pirámide que sea >= imgsz, o el original si no hay
+    pirámide o ningún nivel es suficientemente grande (nunca se entrena sobre imágenes
+    ampliadas).
+    """
+    data_yaml_path = Path(data_yaml_path)
+    manifest_path = pyramid_dir(data_yaml_path) / MANIFEST
+    if not manifest_path.exists():
+        return str(data_yaml_path)
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get("signature") != source_signature(data_yaml_path):
+        logger.warning(
+            f"La pirámide de {data_yaml_path} no corresponde a la versión actual del dataset; "
+            f"se usan las imágenes originales. Regénérala con src/tools/image_pyramid.py."
+        )
+        return str(data_yaml_path)
+    levels = manifest["levels"]
+    candidates = sorted(int(level) for level in levels if int(level) >= imgsz)
+    if not candidates:
+        return str(data_yaml_path)
+    level_yaml = manifest_path.parent / str(candidates[0]) / "data.yaml"
+    logger.info(f"Usando el nivel {candidates[0]} de la pirámide para imgsz={imgsz}: {level_yaml}")
+    return str(level_yaml)
+
+
+def resize_image(src: Path, dst: Path, size: int) -> bool:
+    """Reduce `src` para que su lado largo mida `size`. Devuelve False si ya estaba al día."""
+    if dst.exists() and dst.stat().st_mtime >= src.stat().st_mtime:
+        return False
+    with Image.open(src) as image:
+        # draft() deja que el decodificador JPEG reduzca directamente (mucho más rápido)
+        image.draft("RGB", (size, size))
+        # Los originales se leen con cv2, que aplica la orientación EXIF; aquí se aplica
+        # antes de reducir porque la imagen guardada ya no lleva EXIF
+        image = ImageOps.exif_transpose(image).convert("RGB")
+        scale = size / max(image.size)
+        if scale < 1:
+            new_size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+            image = image.resize(new_size, Image.BILINEAR, reducing_gap=2.0)
+        dst.parent.mkdir(parents=True, exist_ok=True)
+        tmp = dst.with_name(f".{dst.name}")
+        image.save(tmp, format=Image.registered_extensions()[dst.suffix.lower()], quality=95)
+        os.replace(tmp, dst)  # Un nivel a medio escribir no deja imágenes corruptas
+    return True
+
+
+@app.command()
+def main(
+    data_yaml_path: Path = typer.Option(Path("data/processed/final_dataset/data.yaml"), "--data", help="data.yaml del dataset original."),
+    levels: str = typer.Option("320,480,640,960", "--levels", help="Tamaños (lado largo) a generar, separados por comas."),
+    workers: int = typer.Option(os.cpu_count() or 1, "--workers", help="Procesos para redimensionar."),
+):
+    """
+    Genera (o actualiza) los niveles de la pirámide de un dataset. Sólo se procesan las
+    imágenes nuevas o modificadas desde la última vez, se borran las que ya no están en el
+    original y se actualizan también los niveles generados antes que no se pidan ahora.
+    """
+    with open(data_yaml_path, "r", encoding="utf-8") as f:
+        data_cfg = yaml.safe_load(f)
+    root = dataset_root(data_yaml_path)
+    out_root = pyramid_dir(data_yaml_path)
+    sizes = {int(s) for s in levels.split(",")}
+    manifest_path = out_root / MANIFEST
+    if manifest_path.exists():
+        # Todos los niveles existentes se sincronizan con el original, no sólo los pedidos
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            sizes |= set(json.load(f)["levels"])
+    sizes = sorted(sizes)
+
+    signature = source_signature(data_yaml_path)
+    images, labels = source_files(data_yaml_path)
+    if not images:
+        logger.error(f"No se encontraron imágenes en {root}.")
+        raise typer.Exit(code=1)
+
+    for size in sizes:
+        level_root = out_root / str(size)
+        jobs = [(src, level_root / src.relative_to(root), size) for src in images]
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            done = list(tqdm(
+                pool.map(resize_image, *zip(*jobs), chunksize=16),
+                total=len(jobs), desc=f"Nivel {size}", colour="green",
+            ))
+
+        # Etiquetas: mismas coordenadas normalizadas, se enlazan sin tocarlas
+        for src in labels:
+            if not is_up_to_date(src, level_root / src.relative_to(root)):
+                link_or_copy(src, level_root / src.relative_to(root))
+
+        # Lo que ya no está en el original (imágenes movidas de split, eliminadas...) sobra
+        expected = {dst for _, dst, _ in jobs} | {level_root / src.relative_to(root) for src in labels}
+        expected.add(level_root / "data.yaml")
+        removed = 0
+        for path in level_root.rglob("*"):
+            if path.is_file() and path not in expected:
+                path.unlink()
+                removed += 1
+        if removed:
+            logger.info(f"Nivel {size}: eliminados {removed} ficheros que ya no están en el original.")
+
+        level_cfg = dict(data_cfg, path=str(level_root.resolve()))
+        with open(level_root / "data.yaml", "w", encoding="utf-8") as f:
+            yaml.dump(level_cfg, f, sort_keys=False)
+        logger.info(f"Nivel {size}: {sum(done)} imágenes nuevas o actualizadas de {len(jobs)}.")
+
+    manifest = {"source": str(data_yaml_path.resolve()), "levels": sizes, "signature": signature}
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    logger.success(f"✅ Pirámide guardada en '{out_root}'")
+
+
+if __name__ == "__main__":
+    app()
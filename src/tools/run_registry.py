@@ -0,0 +1,345 @@
+"""
+Registro local (SQLite) de los entrenamientos guardados en models/.
+
+Cada carpeta de run de Ultralytics (results.csv, args.yaml, weights/) se ingiere en dos
+tablas: `runs` (hiperparámetros, mejores métricas, tiempos, imágenes/s y hash de los pesos)
+y `epochs` (métricas y tiempo de cada época). La ingesta es incremental: sólo se releen
+los runs cuyos ficheros han cambiado desde la última vez.
+"""
+import csv
+from datetime import datetime
+import json
+import os
+from pathlib import Path
+import sqlite3
+import sys
+import time
+
+from loguru import logger
+import typer
+import yaml
+
+# Permite importar los módulos de src/ al ejecutar como script (python src/tools/...)
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from config import IMAGE_EXTENSIONS  # noqa: E402
+from tools.dedup import file_hash  # noqa: E402
+
+PROJ_ROOT = Path(__file__).resolve().parents[2]
+MODELS_DIR = PROJ_ROOT / "models"
+DEFAULT_DB = MODELS_DIR / "registry.sqlite"
+TIMING_FILENAME = "timing.csv"
+SOURCE_ENV = "RUN_REGISTRY_SOURCE"  # Permite a run_experiments.py marcar los runs que lanza
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    name TEXT PRIMARY KEY,
+    path TEXT,
+    source TEXT,
+    model TEXT,
+    data TEXT,
+    epochs_planned INTEGER,
+    epochs_done INTEGER,
+    imgsz INTEGER,
+    batch INTEGER,
+    args_json TEXT,
+    best_map50 REAL,
+    best_map50_95 REAL,
+    best_epoch INTEGER,
+    total_time_s REAL,
+    mean_epoch_time_s REAL,
+    images_per_sec REAL,
+    weights_path TEXT,
+    weights_sha1 TEXT,
+    signature TEXT,
+    ingested_at TEXT
+);
+CREATE TABLE IF NOT EXISTS epochs (
+    run TEXT,
+    epoch INTEGER,
+    precision REAL,
+    recall REAL,
+    map50 REAL,
+    map50_95 REAL,
+    train_box_loss REAL,
+    val_box_loss REAL,
+    time_s REAL,
+    epoch_time_s REAL,
+    val_time_s REAL,
+    images_per_sec REAL,
+    PRIMARY KEY (run, epoch)
+);
+"""
+
+EPOCH_COLUMNS = {
+    "metrics/precision(B)": "precision",
+    "metrics/recall(B)": "recall",
+    "metrics/mAP50(B)": "map50",
+    "metrics/mAP50-95(B)": "map50_95",
+    "train/box_loss": "train_box_loss",
+    "val/box_loss": "val_box_loss",
+}
+
+app = typer.Typer()
+
+
+def connect(db_path: Path = DEFAULT_DB) -> sqlite3.Connection:
+    db_path.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def _read_csv(path: Path) -> list[dict]:
+    if not path.exists():
+        return []
+    with open(path, newline="", encoding="utf-8") as f:
+        # Las cabeceras de Ultralytics antiguas vienen con espacios de relleno
+        return [{k.strip(): (v.strip() if v else v) for k, v in row.items()} for row in csv.DictReader(f)]
+
+
+def _float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _signature(run_dir: Path) -> str:
+    parts = []
+    for name in ("results.csv", "args.yaml", TIMING_FILENAME, "weights/best.pt"):
+        path = run_dir / name
+        if path.exists():
+            stat = path.stat()
+            parts.append(f"{name}:{stat.st_mtime_ns}:{stat.st_size}")
+    return "|".join(parts)
+
+
+def _train_image_count(args: dict):
+    """Número de imágenes de entrenamiento según el data.yaml del run (si sigue existiendo)."""
+    data_path = Path(str(args.get("data", "")))
+    if not data_path.is_file():
+        return None
+    with open(data_path, "r", encoding="utf-8") as f:
+        data_cfg = yaml.safe_load(f) or {}
+    train_dir = Path(data_cfg.get("path") or data_path.parent) / str(data_cfg.get("train", ""))
+    if not train_dir.is_dir():
+        return None
+    return sum(1 for p in train_dir.glob("*.*") if p.suffix.lower() in IMAGE_EXTENSIONS)
+
+
+def ingest_run(run_dir: Path, conn: sqlite3.Connection, source: str | None = None, force: bool = False) -> bool:
+    """Ingiere (o actualiza) un run. Devuelve False si no había cambios o no es un run."""
+    run_dir = Path(run_dir)
+    results = _read_csv(run_dir / "results.csv")
+    if not results:
+        return False
+    # Con exist_ok=True un nuevo entrenamiento añade sus filas al results.csv anterior:
+    # nos quedamos con el último tramo (donde la numeración de épocas deja de crecer)
+    epochs_seen = [int(float(r["epoch"])) for r in results]
+    restarts = [i for i in range(1, len(epochs_seen)) if epochs_seen[i] <= epochs_seen[i - 1]]
+    results = results[restarts[-1]:] if restarts else results
+    signature = _signature(run_dir)
+    previous = conn.execute("SELECT signature, source FROM runs WHERE name = ?", (run_dir.name,)).fetchone()
+    if previous and previous["signature"] == signature and not force and (source is None or source == previous["source"]):
+        return False
+
+    args = {}
+    if (run_dir / "args.yaml").exists():
+        with open(run_dir / "args.yaml", "r", encoding="utf-8") as f:
+            args = yaml.safe_load(f) or {}
+
+    # Tiempo por época: timing.csv (callback de track, sólo entrenamiento) si existe; si no,
+    # la columna acumulada 'time' de results.csv (versiones recientes de Ultralytics), que
+    # incluye también la validación
+    timing = {int(r["epoch"]): r for r in _read_csv(run_dir / TIMING_FILENAME)}
+    train_images = _train_image_count(args)
+
+    epoch_rows, previous_time = [], 0.0
+    for row in results:
+        epoch = int(float(row["epoch"]))
+        cumulative = _float(row.get("time"))
+        epoch_time = _float(timing.get(epoch, {}).get("epoch_time_s"))
+        if epoch_time is None and cumulative is not None:
+            epoch_time = cumulative - previous_time
+        previous_time = cumulative if cumulative is not None else previous_time
+        val_time = _float(timing.get(epoch, {}).get("val_time_s"))
+        images_per_sec = _float(timing.get(epoch, {}).get("images_per_sec"))
+        if images_per_sec is None and train_images and epoch_time:
+            images_per_sec = train_images / epoch_time
+        values = {col: _float(row.get(src)) for src, col in EPOCH_COLUMNS.items()}
+        epoch_rows.append({
+            "run": run_dir.name, "epoch": epoch, **values,
+            "time_s": cumulative, "epoch_time_s": epoch_time, "val_time_s": val_time,
+            "images_per_sec": images_per_sec,
+        })
+
+    scored = [r for r in epoch_rows if r["map50_95"] is not None]
+    best = max(scored, key=lambda r: r["map50_95"]) if scored else {}
+    epoch_times = [r["epoch_time_s"] for r in epoch_rows if r["epoch_time_s"]]
+    speeds = [r["images_per_sec"] for r in epoch_rows if r["images_per_sec"]]
+    weights = run_dir / "weights" / "best.pt"
+
+    run_row = {
+        "name": run_dir.name,
+        "path": str(run_dir.resolve()),
+        "source": source or (previous["source"] if previous else None),
+        "model": str(args.get("model", "")),
+        "data": str(args.get("data", "")),
+        "epochs_planned": args.get("epochs"),
+        "epochs_done": len(epoch_rows),
+        "imgsz": args.get("imgsz"),
+        "batch": args.get("batch"),
+        "args_json": json.dumps(args, default=str),
+        "best_map50": best.get("map50"),
+        "best_map50_95": best.get("map50_95"),
+        "best_epoch": best.get("epoch"),
+        "total_time_s": sum(epoch_times) if epoch_times else None,
+        "mean_epoch_time_s": sum(epoch_times) / len(epoch_times) if epoch_times else None,
+        "images_per_sec": sum(speeds) / len(speeds) if speeds else None,
+        "weights_path": str(weights) if weights.exists() else None,
+        "weights_sha1": file_hash(weights) if weights.exists() else None,
+        "signature": signature,
+        "ingested_at": datetime.now().isoformat(timespec="seconds"),
+    }
+
+    with conn:
+        conn.execute(
+            f"INSERT OR REPLACE INTO runs ({', '.join(run_row)}) VALUES ({', '.join('?' * len(run_row))})",
+            list(run_row.values()),
+        )
+        conn.execute("DELETE FROM epochs WHERE run = ?", (run_dir.name,))
+        conn.executemany(
+            f"INSERT INTO epochs ({', '.join(epoch_rows[0])}) VALUES ({', '.join('?' * len(epoch_rows[0]))})",
+            [list(r.values()) for r in epoch_rows],
+        )
+    return True
+
+
+def ingest_all(models_dir: Path = MODELS_DIR, db_path: Path = DEFAULT_DB) -> int:
+    conn = connect(db_path)
+    updated = sum(ingest_run(run_dir, conn) for run_dir in sorted(models_dir.iterdir()) if run_dir.is_dir())
+    conn.close()
+    return updated
+
+
+def track(model, source: str, db_path: Path = DEFAULT_DB):
+    """
+    Añade a un modelo YOLO los callbacks que guardan el tiempo real y las imágenes/s de
+    cada época en <run>/timing.csv y registran el run en la base de datos al terminar.
+    El tiempo de entrenamiento termina en on_train_epoch_end; la validación (y el guardado
+    de pesos) hasta on_fit_epoch_end se guarda aparte en val_time_s.
+    El origen se puede sobrescribir con la variable de entorno RUN_REGISTRY_SOURCE.
+    """
+    source = os.environ.get(SOURCE_ENV, source)
+    state = {"start": None, "train_end": None}
+
+    def on_train_epoch_start(trainer):
+        timing_path = Path(trainer.save_dir) / TIMING_FILENAME
+        if trainer.epoch == 0 and timing_path.exists():
+            timing_path.unlink()  # Run nuevo sobre una carpeta existente (exist_ok=True)
+        state["start"], state["train_end"] = time.perf_counter(), None
+
+    def on_train_epoch_end(trainer):
+        state["train_end"] = time.perf_counter()
+
+    def on_fit_epoch_end(trainer):
+        if state["start"] is None or state["train_end"] is None:
+            return
+        epoch_time = state["train_end"] - state["start"]
+        val_time = time.perf_counter() - state["train_end"]
+        images = len(trainer.train_loader.dataset)
+        timing_path = Path(trainer.save_dir) / TIMING_FILENAME
+        is_new = not timing_path.exists()
+        with open(timing_path, "a", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            if is_new:
+                writer.writerow(["epoch", "epoch_time_s", "val_time_s", "images", "images_per_sec"])
+            writer.writerow([trainer.epoch + 1, f"{epoch_time:.3f}", f"{val_time:.3f}", images, f"{images / epoch_time:.2f}"])
+
+    def on_train_end(trainer):
+        conn = connect(db_path)
+        ingest_run(Path(trainer.save_dir), conn, source=source, force=True)
+        conn.close()
+        logger.info(f"Run '{Path(trainer.save_dir).name}' registrado en {db_path}")
+
+    model.add_callback("on_train_epoch_start", on_train_epoch_start)
+    model.add_callback("on_train_epoch_end", on_train_epoch_end)
+    model.add_callback("on_fit_epoch_end", on_fit_epoch_end)
+    model.add_callback("on_train_end", on_train_end)
+    return model
+
+
+def _print_rows(rows, columns):
+    if not rows:
+        typer.echo("(sin resultados)")
+        return
+
+    def fmt(value):
+        if isinstance(value, float):
+            return f"{value:.4f}" if abs(value) < 100 else f"{value:.1f}"
+        return "" if value is None else str(value)
+
+    table = [[fmt(row[c]) for c in columns] for row in rows]
+    widths = [max(len(c), *(len(r[i]) for r in table)) for i, c in enumerate(columns)]
+    typer.echo("  ".join(c.ljust(w) for c, w in zip(columns, widths)))
+    for r in table:
+        typer.echo("  ".join(v.ljust(w) for v, w in zip(r, widths)))
+
+
+@app.command()
+def ingest(
+    models_dir: Path = typer.Option(MODELS_DIR, "--models-dir", help="Carpeta con los runs."),
+    db_path: Path = typer.Option(DEFAULT_DB, "--db", help="Base de datos SQLite."),
+):
+    """Ingiere los runs nuevos o modificados de models/."""
+    updated = ingest_all(models_dir, db_path)
+    logger.success(f"✅ {updated} runs nuevos o actualizados en {db_path}")
+
+
+@app.command()
+def query(
+    sort: str = typer.Option("best_map50_95", "--sort", help="Columna por la que ordenar (desc)."),
+    where: str = typer.Option(None, "--where", help="Filtro SQL sobre la tabla runs (ej: \"best_map50_95 > 0.4\")."),
+    limit: int = typer.Option(20, "--limit", help="Número máximo de runs."),
+    cheapest: bool = typer.Option(False, "--cheapest", help="Ordenar por tiempo total ascendente (el run bueno más barato)."),
+    db_path: Path = typer.Option(DEFAULT_DB, "--db", help="Base de datos SQLite."),
+):
+    """Lista los runs registrados."""
+    columns = ["name", "source", "model", "imgsz", "batch", "epochs_done", "best_map50", "best_map50_95",
+               "mean_epoch_time_s", "images_per_sec", "total_time_s"]
+    if sort not in columns + ["ingested_at", "best_epoch"]:
+        logger.error(f"Columna de orden desconocida: {sort}")
+        raise typer.Exit(code=1)
+    # Los runs sin tiempos (ingeridos de un results.csv sin columna 'time') van al final
+    order = "total_time_s IS NULL, total_time_s ASC" if cheapest else f"{sort} DESC"
+    sql = f"SELECT * FROM runs {'WHERE ' + where if where else ''} ORDER BY {order} LIMIT ?"
+    conn = connect(db_path)
+    _print_rows(conn.execute(sql, (limit,)).fetchall(), columns)
+
+
+@app.command()
+def epochs(
+    run: str = typer.Argument(..., help="Nombre del run (carpeta en models/)."),
+    db_path: Path = typer.Option(DEFAULT_DB, "--db", help="Base de datos SQLite."),
+):
+    """Métricas y tiempos por época de un run."""
+    conn = connect(db_path)
+    rows = conn.execute("SELECT * FROM epochs WHERE run = ? ORDER BY epoch", (run,)).fetchall()
+    _print_rows(rows, ["epoch", "map50", "map50_95", "train_box_loss", "val_box_loss", "epoch_time_s", "val_time_s", "images_per_sec"])
+
+
+@app.command()
+def sql(
+    statement: str = typer.Argument(..., help="Consulta SQL libre sobre las tablas runs y epochs."),
+    db_path: Path = typer.Option(DEFAULT_DB, "--db", help="Base de datos SQLite."),
+):
+    """Ejecuta una consulta SQL arbitraria (sólo lectura recomendada)."""
+    conn = connect(db_path)
+    cursor = conn.execute(statement)
+    rows = cursor.fetchall()
+    _print_rows(rows, [d[0] for d in cursor.description] if cursor.description else [])
+
+
+if __name__ == "__main__":
+    app()
@@ -1,10 +1,14 @@
 import typer
 from pathlib import Path
-import random
 import shutil
+import sys
 from loguru import logger
 from tqdm import tqdm
 
+# Permite importar los módulos de src/ al ejecutar como script (python src/tools/...)
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from tools.split_strategies import SplitStrategy, assign_splits, build_index, parse_ratios  # noqa: E402
+
 app = typer.Typer()
 
 @app.command()
@@ -12,44 +16,43 @@ def split_data(
     input_dir: Path = typer.Option(..., "--input-dir", help="Directorio con los datos originales (con carpetas 'images' y 'labels')."),
     output_dir: Path = typer.Option(..., "--output-dir", help="Directorio donde se guardará el dataset dividido."),
     ratios: str = typer.Option("0.7,0.2,0.1", "--ratios", help="Proporciones para train,valid,test separadas por comas."),
-    seed: int = typer.Option(42, "--seed", help="Semilla para la división aleatoria.")
+    seed: int = typer.Option(42, "--seed", help="Semilla para la división aleatoria."),
+    strategy: SplitStrategy = typer.Option(SplitStrategy.random, "--strategy", help="Estrategia de división: random, day, group o stratified."),
+    group_key: str = typer.Option(None, "--group-key", help="Campo de los metadatos JSON usado para agrupar con --strategy group (ej. la cama). Obligatorio con esa estrategia."),
+    metadata_dir: Path = typer.Option(None, "--metadata-dir", help="Directorio con los JSON de metadatos. Por defecto '<input-dir>/data'."),
 ):
     """
     Divide un dataset de imágenes y etiquetas en conjuntos de train, valid y test.
     """
-    logger.info(f"Iniciando la división del dataset en '{input_dir}'...")
-    random.seed(seed)
-    
+    logger.info(f"Iniciando la división del dataset en '{input_dir}' (estrategia: {strategy.value})...")
+
     # --- 1. Validar y Parsear Ratios ---
     try:
-        train_r, val_r, test_r = [float(x) for x in ratios.split(',')]
-        assert abs(sum([train_r, val_r, test_r]) - 1.0) < 1e-8, "Los ratios deben sumar 1."
-    except (ValueError, AssertionError) as e:
+        split_ratios = parse_ratios(ratios)
+    except ValueError as e:
         logger.error(f"Error en los ratios: {e}")
         raise typer.Exit()
 
-    # --- 2. Descubrir Ficheros ---
+    # --- 2. Construir el Índice (cacheado) ---
     labels_dir = input_dir / "labels"
     images_dir = input_dir / "images"
-    
-    all_label_paths = [p for p in labels_dir.glob("*.txt") if p.read_text(encoding="utf-8").strip()]
-    if not all_label_paths:
+
+    index = build_index(labels_dir, images_dir, metadata_dir)
+    if index.empty or not (index["n_boxes"] > 0).any():
         logger.error(f"No se encontraron ficheros de etiquetas en {labels_dir}")
         raise typer.Exit()
+    index = index[index["n_boxes"] > 0].reset_index(drop=True)
 
-    logger.info(f"Encontrados {len(all_label_paths)} pares de imagen/etiqueta.")
-    random.shuffle(all_label_paths)
+    logger.info(f"Encontrados {len(index)} pares de imagen/etiqueta.")
 
     # --- 3. Calcular y Asignar Divisiones ---
-    total_count = len(all_label_paths)
-    train_count = int(total_count * train_r)
-    val_count = int(total_count * val_r)
-    
-    splits = {
-        "train": all_label_paths[:train_count],
-        "val": all_label_paths[train_count : train_count + val_count],
-        "test": all_label_paths[train_count + val_count :],
-    }
+    try:
+        index["split"] = assign_splits(index, split_ratios, strategy, group_key=group_key, seed=seed)
+    except ValueError as e:
+        logger.error(f"No se pudo dividir el dataset: {e}")
+        raise typer.Exit()
+
+    splits = {name: index[index["split"] == name] for name in split_ratios}
 
     logger.success(f"División calculada: {len(splits['train'])} Train | {len(splits['val'])} Val | {len(splits['test'])} Test")
 
@@ -63,22 +66,11 @@ def split_data(
         (output_dir / "labels" / split_name).mkdir(parents=True, exist_ok=True)
 
     # --- 5. Copiar Ficheros ---
-    for split_name, label_paths in splits.items():
+    for split_name, records in splits.items():
         logger.info(f"Copiando ficheros de '{split_name}'...")
-        for label_path in tqdm(label_paths, desc=f"Copiando {split_name}"):
-            # Encontrar imagen correspondiente con cualquier extensión
-            base_name = label_path.stem
-            possible_images = list(images_dir.glob(f"{base_name}.*"))
-            image_extensions = {".jpg", ".jpeg", ".png", ".webp", ".bmp"}
-            valid_images = [p for p in possible_images if p.suffix.lower() in image_extensions]
-
-            if valid_images:
-                image_path = valid_images[0]
-                # Copiar ambos ficheros
-                shutil.copy(label_path, output_dir / "labels" / split_name)
-                shutil.copy(image_path, output_dir / "images" / split_name)
-            else:
-                logger.warning(f"No se encontró imagen para la etiqueta {label_path.name}, se omitirá.")
+        for label_path, image_path in tqdm(zip(records["label_path"], records["image_path"]), total=len(records), desc=f"Copiando {split_name}"):
+            shutil.copy(label_path, output_dir / "labels" / split_name)
+            shutil.copy(image_path, output_dir / "images" / split_name)
 
     logger.success(f"¡Dataset dividido con éxito en '{output_dir}'!")
 
@@ -0,0 +1,211 @@
+"""
+Estrategias de división del dataset (random, por día, por grupo y estratificada).
+
+Todas las estrategias trabajan sobre un índice tabular (un DataFrame con una fila
+por par imagen/etiqueta) que se cachea en disco y sólo se recalcula para los
+ficheros que han cambiado. La asignación a train/val/test se hace en una única
+pasada vectorizada y es reproducible con la semilla.
+"""
+from enum import Enum
+import json
+from pathlib import Path
+
+from loguru import logger
+import numpy as np
+import pandas as pd
+
+from config import IMAGE_EXTENSIONS
+
+INDEX_FILENAME = ".index.csv"
+
+
+class SplitStrategy(str, Enum):
+    random = "random"          # Imagen a imagen, como hasta ahora
+    day = "day"                # Todas las imágenes de una misma fecha van al mismo split
+    group = "group"            # Agrupa por un campo de los metadatos (ej. la cama)
+    stratified = "stratified"  # Imagen a imagen, estratificando por número de cajas
+
+
+def _count_boxes(label_path: Path) -> int:
+    with open(label_path, encoding="utf-8") as f:
+        return sum(1 for line in f if line.strip())
+
+
+def _read_metadata(metadata_path: Path) -> dict:
+    """
+    Devuelve los campos escalares del JSON con el prefijo 'meta_' (vacío si no existe).
+    Se guardan como texto para que las claves de grupo sean las mismas se lean del JSON o
+    de la caché (una columna entera con algún hueco se leería como float: '3' -> '3.0').
+    """
+    if not metadata_path.exists():
+        return {}
+    try:
+        with open(metadata_path, "r", encoding="utf-8") as f:
+            metadata = json.load(f)
+    except (json.JSONDecodeError, OSError) as e:
+        logger.warning(f"Error leyendo {metadata_path.name}: {e}. Se ignorarán sus metadatos.")
+        return {}
+    return {
+        f"meta_{k}": str(v) for k, v in metadata.items() if isinstance(v, (str, int, float, bool))
+    }
+
+
+def _index_row(label_path: Path, image_path: Path, metadata_path: Path, stamp: str) -> dict:
+    row = {
+        "stem": label_path.stem,
+        "image_path": str(image_path),
+        "label_path": str(label_path),
+        "metadata_path": str(metadata_path),
+        "stamp": stamp,
+        "n_boxes": _count_boxes(label_path),
+    }
+    row.update(_read_metadata(metadata_path))
+    return row
+
+
+def build_index(
+    labels_dir: Path,
+    images_dir: Path,
+    metadata_dir: Path | None = None,
+    cache_path: Path | None = None,
+) -> pd.DataFrame:
+    """
+    Construye (o actualiza) el índice del dataset.
+
+    Cada fila contiene las rutas de imagen, etiqueta y metadatos, el número de cajas,
+    los campos escalares del JSON (prefijo 'meta_') y el día de cultivo ('day').
+    El índice se guarda en `cache_path` (por defecto `<labels_dir>/../.index.csv`) y
+    en las siguientes ejecuciones sólo se releen los pares cuya etiqueta, imagen o JSON
+    cambió de mtime/tamaño.
+    """
+    metadata_dir = metadata_dir or labels_dir.parent / "data"
+    cache_path = cache_path or labels_dir.parent / INDEX_FILENAME
+
+    # Un único listado del directorio de imágenes en lugar de un glob por etiqueta
+    images_by_stem = {}
+    for p in sorted(images_dir.glob("*.*")):
+        if p.suffix.lower() in IMAGE_EXTENSIONS:
+            images_by_stem.setdefault(p.stem, p)
+
+    cached = {}
+    if cache_path.exists():
+        columns = pd.read_csv(cache_path, nrows=0).columns
+        dtypes = {c: str for c in columns if c.startswith("meta_")} | {"stem": str, "stamp": str}
+        cached_df = pd.read_csv(cache_path, dtype=dtypes)
+        cached = {row["label_path"]: row for row in cached_df.to_dict("records")}
+
+    rows, reused = [], 0
+    for label_path in sorted(labels_dir.glob("*.txt")):
+        image_path = images_by_stem.get(label_path.stem)
+        if image_path is None:
+            logger.warning(f"No se encontró imagen para la etiqueta {label_path.name}, se omitirá.")
+            continue
+        metadata_path = metadata_dir / f"{label_path.stem}.json"
+        stats = [label_path.stat(), image_path.stat()]
+        if metadata_path.exists():
+            stats.append(metadata_path.stat())
+        stamp = "|".join(f"{s.st_mtime_ns}:{s.st_size}" for s in stats) + f"|{image_path.name}"
+
+        previous = cached.get(str(label_path))
+        if previous is not None and previous["stamp"] == stamp:
+            rows.append(previous)
+            reused += 1
+        else:
+            rows.append(_index_row(label_path, image_path, metadata_path, stamp))
+
+    index = pd.DataFrame(rows)
+    if index.empty:
+        return index
+
+    # Día de cultivo calculado sobre toda la columna de una vez
+    if {"meta_dia_entrada", "meta_fecha"} <= set(index.columns):
+        start = pd.to_datetime(index["meta_dia_entrada"], format="%Y-%m-%d", errors="coerce")
+        taken = pd.to_datetime(index["meta_fecha"], format="%Y-%m-%d", errors="coerce")
+        index["day"] = (taken - start).dt.days
+    else:
+        index["day"] = np.nan
+
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    index.to_csv(cache_path, index=False)
+    logger.info(
+        f"Índice con {len(index)} registros ({reused} reutilizados de la caché '{cache_path}')."
+    )
+    return index
+
+
+def assign_splits(
+    index: pd.DataFrame,
+    ratios: dict[str, float],
+    strategy: SplitStrategy = SplitStrategy.random,
+    group_key: str | None = None,
+    n_bins: int = 4,
+    seed: int = 42,
+) -> pd.Series:
+    """
+    Asigna cada fila del índice a un split. Devuelve una Serie alineada con `index`.
+
+    - random: permutación de imágenes sueltas.
+    - stratified: permutación dentro de cada cuantil de número de cajas, de forma que
+      cada split recibe la misma proporción de imágenes con pocas y muchas cajas.
+    - day / group: se reparten grupos completos (fecha o `group_key` de los metadatos)
+      para que los fotogramas casi idénticos no acaben en train y val a la vez. Los
+      grupos también se estratifican por su número medio de cajas.
+
+    Los ratios se respetan en número de imágenes, no de grupos.
+    """
+    names = list(ratios)
+    cum_ratios = np.cumsum([ratios[n] for n in names], dtype=float)
+    cum_ratios /= cum_ratios[-1]
+    rng = np.random.default_rng(seed)
+
+    if strategy == SplitStrategy.group and not group_key:
+        raise ValueError("La estrategia 'group' necesita el campo de agrupación (--group-key).")
+    if strategy in (SplitStrategy.day, SplitStrategy.group):
+        key = "meta_fecha" if strategy == SplitStrategy.day else f"meta_{group_key}"
+        if key not in index.columns:
+            raise ValueError(f"El índice no contiene el campo '{key[5:]}' en los metadatos.")
+        # Las filas sin valor forman su propio grupo para no mezclarlas todas juntas
+        groups = index[key].astype(str).where(index[key].notna(), "__" + index["stem"])
+        units = index.groupby(groups, sort=True)["n_boxes"].agg(["size", "mean"])
+        weights, box_stat = units["size"].to_numpy(), units["mean"].to_numpy()
+    else:
+        groups = None
+        weights, box_stat = np.ones(len(index)), index["n_boxes"].to_numpy()
+
+    if strategy == SplitStrategy.random:
+        strata = np.zeros(len(weights), dtype=int)
+    else:
+        # Con pocas unidades, muchos estratos impedirían respetar los ratios
+        n_bins = max(1, min(n_bins, len(weights) // (2 * len(names))))
+        # Cuantiles de número de cajas; rank() evita bins vacíos con muchos empates
+        ranks = pd.Series(box_stat).rank(method="first").to_numpy()
+        strata = np.minimum((ranks - 1) * n_bins // len(ranks), n_bins - 1).astype(int)
+
+    # Orden aleatorio dentro de cada estrato y fracción acumulada del peso del estrato
+    order = np.lexsort((rng.random(len(weights)), strata))
+    w_sorted, s_sorted = weights[order], strata[order]
+    cum = np.cumsum(w_sorted)
+    starts = np.searchsorted(s_sorted, s_sorted, side="left")
+    ends = np.searchsorted(s_sorted, s_sorted, side="right")
+    before = np.where(starts > 0, cum[starts - 1], 0)
+    stratum_total = cum[ends - 1] - before
+    position = (cum - before - w_sorted / 2) / stratum_total
+
+    unit_split = np.empty(len(weights), dtype=int)
+    unit_split[order] = np.minimum(np.searchsorted(cum_ratios, position, side="right"), len(names) - 1)
+
+    if groups is None:
+        split_idx = unit_split
+    else:
+        split_idx = pd.Series(unit_split, index=units.index).loc[groups].to_numpy()
+    return pd.Series(np.asarray(names)[split_idx], index=index.index, name="split")
+
+
+def parse_ratios(ratios: str, names=("train", "val", "test")) -> dict[str, float]:
+    """Convierte '0.7,0.2,0.1' en {'train': 0.7, 'val': 0.2, 'test': 0.1}."""
+    values = [float(x) for x in ratios.split(",")]
+    if len(values) != len(names):
+        raise ValueError(f"Se esperaban {len(names)} ratios y se recibieron {len(values)}.")
+    if abs(sum(values) - 1.0) > 1e-8:
+        raise ValueError("Los ratios deben sumar 1.")
+    return dict(zip(names, values))